@@ -0,0 +1,74 @@
+import os
+import zipfile
+import zlib
+
+SUPPORTED_EXTENSIONS = (".zip",)
+
+CHUNK_SIZE = 65536
+
+
+class ArchiveMember:
+    name = ""
+    size = 0
+    crc32 = ""
+
+    def __init__(self, name, size, crc32):
+        self.name = name
+        self.size = size
+        self.crc32 = crc32
+
+    def __str__(self):
+        return "name: " + self.name + \
+            "; size: " + str(self.size) + \
+            "; crc32: " + self.crc32
+
+
+def is_supported(path):
+    return os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def __verify_member(zip_file, info):
+    crc = 0
+    with zip_file.open(info) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    return crc & 0xFFFFFFFF
+
+
+'''
+    Returns list of ArchiveMember for the files in the archive, in archive order.
+
+    CRCs are read from the zip central directory, so nothing is decompressed unless
+    verify is set, in which case each member is stream-decompressed and its CRC
+    checked against the directory.
+'''
+def get_members(path, verify=False):
+    if not is_supported(path):
+        raise Exception("Unsupported archive type: " + path)
+
+    members = []
+    with zipfile.ZipFile(path) as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir():
+                continue
+            if verify:
+                calculated = __verify_member(zip_file, info)
+                if calculated != info.CRC:
+                    raise Exception("CRC mismatch for " + info.filename + " in " + path + ": " + \
+                        ('%08X' % info.CRC) + " vs " + ('%08X' % calculated) + " (directory vs calculated)")
+            members.append(ArchiveMember(info.filename, info.file_size, '%08X' % info.CRC))
+    return members
+
+
+'''
+    Returns the CRC of the first file in the archive, which is the one RetroArch
+    uses when scanning archives.
+'''
+def get_crc32(path, verify=False):
+    members = get_members(path, verify)
+    if not members:
+        raise Exception("Archive is empty: " + path)
+    return members[0].crc32
@@ -0,0 +1,45 @@
+import os
+import stat
+import tempfile
+import threading
+
+__umask = None
+__umask_lock = threading.Lock()
+
+
+'''
+    Returns the process umask. Reading it means setting it, so it's only read once.
+'''
+def get_umask():
+    global __umask
+
+    with __umask_lock:
+        if __umask is None:
+            __umask = os.umask(0o022)
+            os.umask(__umask)
+        return __umask
+
+
+'''
+    Writes to a temporary file next to path and renames it over path, so readers
+    never see a partially written file. The file keeps the mode of the file it
+    replaces, or gets the mode open() would create it with.
+'''
+def atomic_write(path, data):
+    directory = os.path.dirname(path) or "."
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0o666 & ~get_umask()
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
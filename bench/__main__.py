@@ -0,0 +1,318 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing
+import rdb
+import suggest
+import thumbnails
+
+from bench import plugin_host
+from bench import synthetic
+
+PLAYLIST = "Nintendo - Super Nintendo Entertainment System"
+
+SUBSYSTEMS = ["crc", "rdb_read", "lookup", "suggest", "thumbnails", "startup"]
+
+# Modules the plugin should only import once a command needs them. Names starting
+# with "." are the plugin's own helper packages.
+LAZY_MODULES = ["urllib.request", "concurrent.futures", "cProfile", "pstats", "subprocess", "zipfile", "ctypes", "socket",
+    "hashlib", "html", "tempfile", "zlib", ".thumbnails"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+sys.path[:0] = [%r, %r]
+before = set(sys.modules)
+start = time.perf_counter()
+import importlib
+importlib.import_module(%r)
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(set(sys.modules) - before)}))
+"""
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, total_time, units, unit_name):
+    return {
+        "count": len(latencies),
+        "total_s": total_time,
+        "throughput": units / total_time if total_time else 0.0,
+        "throughput_unit": unit_name + "/s",
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0
+    }
+
+
+def bench_crc(work_dir, args):
+    roms = synthetic.make_roms(os.path.join(work_dir, "roms"), args.roms, args.rom_size * 1024)
+    latencies = []
+    start = time.perf_counter()
+    for path, expected in roms:
+        item_start = time.perf_counter()
+        crc = hashing.crc32(path)
+        latencies.append(time.perf_counter() - item_start)
+        if crc != expected:
+            raise Exception("CRC mismatch for " + path)
+    total = time.perf_counter() - start
+    return summarize(latencies, total, len(roms) * args.rom_size / 1024.0, "MB")
+
+
+def bench_rdb_read(work_dir, args):
+    games = synthetic.make_rdb_games(args.games)
+    path = os.path.join(work_dir, PLAYLIST + ".rdb")
+    synthetic.write_rdb(path, games)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.repeat):
+        item_start = time.perf_counter()
+        result = rdb.RdbReader().read(path)
+        latencies.append(time.perf_counter() - item_start)
+        if len(result) != len(games):
+            raise Exception("Read " + str(len(result)) + " games, expected " + str(len(games)))
+    total = time.perf_counter() - start
+    return summarize(latencies, total, len(games) * args.repeat, "games"), games
+
+
+def bench_lookup(work_dir, args, games):
+    rdb.get_cache().clear()
+    rdbs = rdb.load_rdbs(work_dir, [PLAYLIST])
+
+    rng = random.Random(1)
+    queries = []
+    for i in range(args.lookups):
+        name, crc, size, serial = rng.choice(games)
+        kind = rng.random()
+        if kind < 0.7:
+            queries.append((name, crc))
+        elif kind < 0.8:
+            queries.append(("Unknown Game (USA)", crc))
+        elif kind < 0.9:
+            queries.append((name, "00000000"))
+        else:
+            queries.append(("Unknown Game (USA)", "00000000"))
+
+    latencies = []
+    start = time.perf_counter()
+    for name, crc in queries:
+        item_start = time.perf_counter()
+        rdb.find_game_in_rdbs(rdbs, name, crc, PLAYLIST)
+        latencies.append(time.perf_counter() - item_start)
+    total = time.perf_counter() - start
+    return summarize(latencies, total, len(queries), "lookups")
+
+
+def bench_suggest(args, games):
+    start = time.perf_counter()
+    index = suggest.TrigramIndex([game[0] for game in games])
+    build_time = time.perf_counter() - start
+
+    rng = random.Random(3)
+    queries = []
+    for i in range(args.lookups // 10):
+        name = rng.choice(games)[0]
+        position = rng.randrange(len(name))
+        queries.append(name[:position] + name[position + 1:])
+
+    latencies = []
+    start = time.perf_counter()
+    for name in queries:
+        item_start = time.perf_counter()
+        index.query(name)
+        latencies.append(time.perf_counter() - item_start)
+    total = time.perf_counter() - start
+    result = summarize(latencies, total, len(queries), "queries")
+    result["build_s"] = build_time
+    return result
+
+
+def reset_thumbnails(local_root, files, types):
+    shutil.rmtree(local_root, ignore_errors=True)
+    for thumbnail_type in types:
+        os.makedirs(os.path.join(local_root, thumbnail_type), exist_ok=True)
+
+    # Half of the existing thumbnails are already present locally
+    for path, data in list(files.items())[::2]:
+        thumbnail_type, name = path.split("/")[2:4]
+        with open(os.path.join(local_root, thumbnail_type, name), 'wb') as f:
+            f.write(data)
+
+
+'''
+    Runs the plugin's Update Thumbnails command on a synthetic playlist, with the
+    sublime modules stubbed out. Each run starts with half of the thumbnails
+    present locally and empty caches, and is timed as a whole.
+'''
+def bench_thumbnails(work_dir, args):
+    types = [thumbnails.BOXARTS, thumbnails.SNAPS, thumbnails.TITLES, thumbnails.LOGOS]
+    labels = synthetic.make_names(args.labels, 2)
+    files = synthetic.make_thumbnail_files(PLAYLIST, labels, types, args.thumbnail_size * 1024)
+
+    playlist_path = os.path.join(work_dir, "playlists", PLAYLIST + ".lpl")
+    os.makedirs(os.path.dirname(playlist_path), exist_ok=True)
+    synthetic.write_lpl(playlist_path, [(os.path.join(work_dir, "roms", label + ".sfc"), label, None) for label in labels])
+
+    plugin, sublime = plugin_host.load_plugin(os.path.join(work_dir, "stubs"))
+    local_root = os.path.join(work_dir, "thumbnails")
+    cache_dir = os.path.join(work_dir, "cache")
+
+    latencies = []
+    with synthetic.ThumbnailServer(files) as server:
+        sublime.cache_dir = cache_dir
+        sublime.settings.update({
+            "retroarch_local_thumbnails_path": local_root,
+            "retroarch_remote_thumbnails_path": server.get_url(),
+            "remote_thumbnail_index_enabled": not args.no_thumbnail_index
+        })
+        for i in range(args.thumbnail_runs):
+            reset_thumbnails(os.path.join(local_root, PLAYLIST), files, types)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            view = plugin_host.View(playlist_path)
+            run_start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                plugin.LplUpdateThumbnailsCommand(view).run(None)
+            latencies.append(time.perf_counter() - run_start)
+        result = summarize(latencies, sum(latencies), len(labels) * len(types) * args.thumbnail_runs, "thumbnails")
+        result["http_requests"] = server.request_count
+    return result
+
+
+'''
+    Imports the plugin module in a fresh interpreter per run, with stand-ins for
+    the sublime modules. The first run only writes the bytecode cache, so the
+    measured runs match a Sublime Text start after the plugin was loaded once.
+'''
+def bench_startup(work_dir, args):
+    stubs = os.path.join(work_dir, "stubs")
+    plugin_host.write_stubs(stubs)
+    script = IMPORT_SCRIPT % (stubs, os.path.dirname(plugin_host.get_package_root()), plugin_host.get_plugin_module_name())
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    latencies = []
+    modules = []
+    start = time.perf_counter()
+    for i in range(args.import_runs + 1):
+        output = subprocess.check_output([sys.executable, "-c", script], env=env, universal_newlines=True)
+        run = json.loads(output.splitlines()[-1])
+        if i > 0:
+            latencies.append(run["elapsed"])
+            modules = run["modules"]
+    total = time.perf_counter() - start
+    result = summarize(latencies, total, args.import_runs, "imports")
+    result["modules"] = len(modules)
+    package = os.path.basename(plugin_host.get_package_root())
+    lazy_modules = [package + name if name.startswith(".") else name for name in LAZY_MODULES]
+    result["eager_modules"] = [name for name in lazy_modules if name in modules]
+    return result
+
+
+def get_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), universal_newlines=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results, baseline=None):
+    print("")
+    print("subsystem".ljust(12) + "throughput".rjust(20) + "p50 ms".rjust(10) + "p90 ms".rjust(10) + "p99 ms".rjust(10) + "   vs baseline")
+    for name, result in results["results"].items():
+        line = name.ljust(12)
+        line += ("%.1f %s" % (result["throughput"], result["throughput_unit"])).rjust(20)
+        line += ("%.3f" % result["p50_ms"]).rjust(10)
+        line += ("%.3f" % result["p90_ms"]).rjust(10)
+        line += ("%.3f" % result["p99_ms"]).rjust(10)
+        if baseline and name in baseline["results"] and baseline["results"][name]["throughput"]:
+            change = result["throughput"] / baseline["results"][name]["throughput"] - 1
+            line += "   %+.1f%% throughput" % (change * 100)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="LplHelper benchmark suite")
+    parser.add_argument("--roms", type=int, default=50, help="number of synthetic ROMs to hash")
+    parser.add_argument("--rom-size", type=int, default=1024, help="size of each ROM in KB")
+    parser.add_argument("--games", type=int, default=20000, help="number of games in the synthetic RDB")
+    parser.add_argument("--repeat", type=int, default=3, help="number of times to parse the RDB")
+    parser.add_argument("--lookups", type=int, default=20000, help="number of RDB lookups")
+    parser.add_argument("--labels", type=int, default=200, help="number of playlist labels for thumbnail sync")
+    parser.add_argument("--thumbnail-runs", type=int, default=3, help="number of Update Thumbnails runs")
+    parser.add_argument("--thumbnail-size", type=int, default=32, help="size of each thumbnail in KB")
+    parser.add_argument("--no-thumbnail-index", action="store_true", help="probe every thumbnail instead of using the remote listing")
+    parser.add_argument("--import-runs", type=int, default=10, help="number of plugin imports to time")
+    parser.add_argument("--import-budget-ms", type=float, help="exit with an error if the median plugin import takes longer, or imports a module that should be lazy")
+    parser.add_argument("--only", action="append", choices=SUBSYSTEMS, help="run only the given subsystem(s)")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="JSON results from a previous run to compare against")
+    args = parser.parse_args()
+
+    only = set(args.only or SUBSYSTEMS)
+    results = {
+        "version": get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": {}
+    }
+
+    with tempfile.TemporaryDirectory(prefix="lplhelper-bench-") as work_dir:
+        if "crc" in only:
+            results["results"]["crc"] = bench_crc(work_dir, args)
+        if "rdb_read" in only or "lookup" in only or "suggest" in only:
+            rdb_read, games = bench_rdb_read(work_dir, args)
+            if "rdb_read" in only:
+                results["results"]["rdb_read"] = rdb_read
+            if "lookup" in only:
+                results["results"]["lookup"] = bench_lookup(work_dir, args, games)
+            if "suggest" in only:
+                results["results"]["suggest"] = bench_suggest(args, games)
+        if "thumbnails" in only:
+            results["results"]["thumbnails"] = bench_thumbnails(work_dir, args)
+        if "startup" in only:
+            results["results"]["startup"] = bench_startup(work_dir, args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, separators=(',', ': '))
+
+    startup = results["results"].get("startup")
+    if startup and startup["eager_modules"]:
+        print("Plugin import loads " + ", ".join(startup["eager_modules"]) + " eagerly, they should be imported lazily")
+    if startup and args.import_budget_ms is not None:
+        over_budget = startup["p50_ms"] > args.import_budget_ms
+        if over_budget:
+            print("Plugin import is over budget (%.1f ms, budget %.1f ms)" % (startup["p50_ms"], args.import_budget_ms))
+        if over_budget or startup["eager_modules"]:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
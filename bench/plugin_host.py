@@ -0,0 +1,164 @@
+import importlib
+import os
+import sys
+
+SUBLIME_STUB = """
+settings = {}
+messages = []
+cache_dir = ""
+
+
+class Region:
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+
+class Settings:
+
+    def get(self, key, default=None):
+        return settings.get(key, default)
+
+    def set(self, key, value):
+        settings[key] = value
+
+
+def load_settings(name):
+    return Settings()
+
+
+def cache_path():
+    return cache_dir
+
+
+def status_message(message):
+    messages.append(message)
+
+
+def message_dialog(message):
+    messages.append(message)
+
+
+def error_message(message):
+    messages.append(message)
+
+
+def set_timeout(callback, delay=0):
+    callback()
+
+
+def set_timeout_async(callback, delay=0):
+    callback()
+"""
+
+SUBLIME_PLUGIN_STUB = """
+class TextCommand:
+
+    def __init__(self, view):
+        self.view = view
+
+
+class WindowCommand:
+
+    def __init__(self, window):
+        self.window = window
+
+
+class ApplicationCommand:
+    pass
+
+
+class EventListener:
+    pass
+"""
+
+
+'''
+    Writes stand-ins for the sublime and sublime_plugin modules to directory, with
+    just enough of the API for the commands to run outside Sublime Text.
+'''
+def write_stubs(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "sublime.py"), 'w') as f:
+        f.write(SUBLIME_STUB)
+    with open(os.path.join(directory, "sublime_plugin.py"), 'w') as f:
+        f.write(SUBLIME_PLUGIN_STUB)
+
+
+def get_package_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_plugin_module_name():
+    return os.path.basename(get_package_root()) + ".lplhelper"
+
+
+'''
+    Imports the plugin with the stubs written to stubs_dir. Returns the plugin
+    module and the sublime stub, whose settings and cache_dir configure the run.
+'''
+def load_plugin(stubs_dir):
+    write_stubs(stubs_dir)
+    sys.path[:0] = [stubs_dir, os.path.dirname(get_package_root())]
+    return importlib.import_module(get_plugin_module_name()), importlib.import_module("sublime")
+
+
+class OutputPanel:
+
+    def run_command(self, name, args=None):
+        pass
+
+
+class Window:
+
+    def __init__(self):
+        self.view = None
+        self.panels = {}
+
+    def active_view(self):
+        return self.view
+
+    def create_output_panel(self, name):
+        self.panels[name] = OutputPanel()
+        return self.panels[name]
+
+    def find_output_panel(self, name):
+        return self.panels.get(name)
+
+    def run_command(self, name, args=None):
+        pass
+
+
+'''
+    View of a playlist file held in memory; replace() doesn't write to disk.
+'''
+class View:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, encoding='utf-8') as f:
+            self.text = f.read()
+        self.view_window = Window()
+        self.view_window.view = self
+
+    def id(self):
+        return id(self)
+
+    def file_name(self):
+        return self.path
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        return self.text[region.a:region.b]
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.a] + text + self.text[region.b:]
+
+    def window(self):
+        return self.view_window
+
+    def run_command(self, name, args=None):
+        pass
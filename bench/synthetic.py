@@ -0,0 +1,193 @@
+import http.server
+import json
+import os
+import random
+import struct
+import threading
+import zlib
+from urllib.parse import quote, unquote
+
+import thumbnails
+
+REGIONS = ["USA", "Europe", "Japan", "World"]
+WORDS = ["Super", "Mega", "Quest", "Dragon", "Star", "Racing", "Fighter", "Legend", "Island", "Castle",
+         "Adventure", "Soccer", "Puzzle", "Ninja", "Space", "World", "Kart", "Party", "Tactics", "Hero"]
+
+
+def make_names(count, seed=0):
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = " ".join(rng.choice(WORDS) for i in range(rng.randint(2, 4)))
+        name += " (" + rng.choice(REGIONS) + ")"
+        if name in seen:
+            name = name[:-1] + ", Rev " + str(len(names)) + ")"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+'''
+    Writes count ROM files of size bytes each, returns list of (path, crc).
+'''
+def make_roms(directory, count, size, extension=".sfc", seed=0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    result = []
+    for i, name in enumerate(make_names(count, seed)):
+        path = os.path.join(directory, name + extension)
+        data = rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+        with open(path, 'wb') as f:
+            f.write(data)
+        result.append((path, '%08X' % (zlib.crc32(data) & 0xFFFFFFFF)))
+    return result
+
+
+def __pack_str(value):
+    if isinstance(value, str):
+        value = value.encode()
+    if len(value) < 32:
+        return bytes([0xa0 + len(value)]) + value
+    if len(value) < 0x100:
+        return bytes([0xd9, len(value)]) + value
+    return bytes([0xda]) + struct.pack(">H", len(value)) + value
+
+
+def __pack_bin(value):
+    return bytes([0xc4, len(value)]) + value
+
+
+def __pack_uint(value):
+    return bytes([0xce]) + struct.pack(">I", value)
+
+
+def __pack_map(fields):
+    if len(fields) < 16:
+        result = bytes([0x80 + len(fields)])
+    else:
+        result = bytes([0xde]) + struct.pack(">H", len(fields))
+    for key, value in fields:
+        result += __pack_str(key) + value
+    return result
+
+
+'''
+    Writes an RDB in the MessagePack layout RdbReader expects. games is a list of
+    (name, crc, size, serial) with crc as a hex string and serial possibly None.
+'''
+def write_rdb(path, games):
+    body = bytearray()
+    for name, crc, size, serial in games:
+        fields = [
+            ("name", __pack_str(name)),
+            ("rom_name", __pack_str(name + ".sfc")),
+            ("size", __pack_uint(size)),
+            ("crc", __pack_bin(bytes.fromhex(crc)))
+        ]
+        if serial:
+            fields.append(("serial", __pack_str(serial)))
+        body += __pack_map(fields)
+
+    metadata_offset = 0x10 + len(body)
+    with open(path, 'wb') as f:
+        f.write(b"RARCHDB\x00")
+        f.write(struct.pack(">Q", metadata_offset))
+        f.write(body)
+        f.write(__pack_map([("count", __pack_uint(len(games)))]))
+
+
+def make_rdb_games(count, seed=0):
+    rng = random.Random(seed)
+    games = []
+    for name in make_names(count, seed):
+        games.append((name, '%08X' % rng.getrandbits(32), rng.randint(0x40000, 0x400000), None))
+    return games
+
+
+def write_lpl(path, entries, db_name="Nintendo - Super Nintendo Entertainment System.lpl"):
+    items = []
+    for rom_path, label, crc in entries:
+        items.append({
+            "path": rom_path,
+            "label": label,
+            "core_path": "DETECT",
+            "core_name": "DETECT",
+            "crc32": crc + "|crc" if crc else "DETECT",
+            "db_name": db_name
+        })
+    data = {
+        "version": "1.5",
+        "default_core_path": "",
+        "default_core_name": "",
+        "items": items
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, separators=(',', ': '))
+
+
+'''
+    Local stand-in for the remote thumbnail server. files maps URL path
+    ("/<playlist>/<type>/<name>.png") to bytes; everything else returns 404.
+'''
+class ThumbnailServer:
+
+    def __init__(self, files):
+        self.files = files
+        self.request_count = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.request_count += 1
+                path = unquote(self.path)
+                data = server.files.get(path)
+                if data is None and path.endswith("/"):
+                    data = server.get_listing(path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html" if path.endswith("/") else "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def get_listing(self, directory):
+        links = []
+        for path in sorted(self.files):
+            if path.startswith(directory) and "/" not in path[len(directory):]:
+                name = path[len(directory):]
+                links.append('<a href="' + quote(name) + '">' + name + '</a>')
+        if not links:
+            return None
+        return ("<html><body><pre>\n" + "\n".join(links) + "\n</pre></body></html>").encode()
+
+    def get_url(self):
+        return "http://127.0.0.1:" + str(self.httpd.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_thumbnail_files(playlist, labels, types, size, missing_ratio=0.1, seed=0):
+    rng = random.Random(seed)
+    files = {}
+    for label in labels:
+        for thumbnail_type in types:
+            if rng.random() < missing_ratio:
+                continue
+            path = "/" + playlist + "/" + thumbnail_type + "/" + thumbnails.sanitize_label(label) + ".png"
+            files[path] = b"\x89PNG\r\n\x1a\n" + rng.getrandbits(size * 8).to_bytes(size, "little")
+    return files
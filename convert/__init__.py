@@ -0,0 +1,94 @@
+import json
+import os
+import re
+from collections import OrderedDict
+
+# Matches either separator so playlists can be converted from any platform on any platform
+SEPARATOR_REGEX = re.compile(r"[\\/]")
+
+# Path separator and core extension per platform
+PLATFORMS = {
+    "windows": ("\\", ".dll"),
+    "macos": ("/", ".dylib"),
+    "linux": ("/", ".so")
+}
+
+
+'''
+    Rewrites ROM and core paths of a playlist for one target platform. ROMs keep
+    their parent folder name under rom_path, cores their name under core_path.
+'''
+class PathTarget:
+
+    def __init__(self, name, rom_path, core_path, path_separator, core_extension, output_dir=""):
+        if not rom_path:
+            raise Exception("rom_path is not specified for " + name)
+
+        if not core_path:
+            raise Exception("core_path is not specified for " + name)
+
+        self.name = name
+        self.path_separator = path_separator
+        self.core_extension = core_extension
+        self.output_dir = output_dir
+        self.rom_path = rom_path if rom_path.endswith(path_separator) else rom_path + path_separator
+        self.core_path = core_path if core_path.endswith(path_separator) else core_path + path_separator
+
+    '''
+    options is a dict of rom_path, core_path and output_dir, plus path_separator and
+    core_extension for names that aren't in PLATFORMS.
+    '''
+    @staticmethod
+    def from_options(name, options):
+        path_separator, core_extension = PLATFORMS.get(name, ("/", ""))
+        return PathTarget(name, options.get("rom_path", ""), options.get("core_path", ""),
+            options.get("path_separator", path_separator), options.get("core_extension", core_extension),
+            options.get("output_dir", ""))
+
+    def convert_rom_path(self, path):
+        parts = SEPARATOR_REGEX.split(path)
+        rom_folder_name = parts[-2] if len(parts) > 1 else ""
+        return self.rom_path + rom_folder_name + self.path_separator + parts[-1]
+
+    def convert_core_path(self, path):
+        basename = os.path.splitext(SEPARATOR_REGEX.split(path)[-1])[0]
+        return self.core_path + basename + self.core_extension
+
+    '''
+    Returns a converted copy of json_data; json_data itself isn't modified.
+    '''
+    def convert(self, json_data):
+        data = OrderedDict(json_data)
+        data["default_core_path"] = self.convert_core_path(json_data["default_core_path"])
+        data["items"] = []
+        for item in json_data["items"]:
+            item = OrderedDict(item)
+            item["path"] = self.convert_rom_path(item["path"])
+            if item["core_path"] != "DETECT":
+                item["core_path"] = self.convert_core_path(item["core_path"])
+            data["items"].append(item)
+        return data
+
+    def get_output_file(self, playlist_file):
+        return os.path.join(self.output_dir, os.path.basename(playlist_file))
+
+
+def dumps_playlist(json_data):
+    return json.dumps(json_data, indent=2, separators=(',', ': ')) + '\n'
+
+
+def load_playlist(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+'''
+    Converts an already parsed playlist for every target. Yields tuple of the
+    target's output file and the converted data.
+'''
+def convert_for_targets(json_data, playlist_file, targets):
+    for target in targets:
+        output_file = target.get_output_file(playlist_file)
+        if os.path.abspath(output_file) == os.path.abspath(playlist_file):
+            raise Exception("Output for " + target.name + " would overwrite " + playlist_file)
+        yield (output_file, target.convert(json_data))
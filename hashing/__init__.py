@@ -0,0 +1,287 @@
+import collections
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+
+# hashing is a subpackage of the plugin in Sublime Text and a top-level package
+# in the helper service
+try:
+    from ..atomicfile import atomic_write
+except (ImportError, ValueError):
+    from atomicfile import atomic_write
+
+CHUNK_SIZE = 65536
+
+# CRC cache modes
+MTIME = "mtime"
+FINGERPRINT = "fingerprint"
+STRICT = "strict"
+
+DEFAULT_FINGERPRINT_SIZE = 1024 * 1024
+
+
+def crc32(path, offset=0):
+    crc = 0
+
+    with open(path, 'rb', CHUNK_SIZE) as f:
+        f.seek(offset)
+        for x in range(int((os.stat(path).st_size / CHUNK_SIZE)) + 1):
+            crc = zlib.crc32(f.read(CHUNK_SIZE), crc)
+    return '%08X' % (crc & 0xFFFFFFFF)
+
+
+def __read_at(fd, length, offset):
+    if not hasattr(os, "pread"):
+        os.lseek(fd, offset, os.SEEK_SET)
+    data = b""
+    while len(data) < length:
+        if hasattr(os, "pread"):
+            chunk = os.pread(fd, length - len(data), offset + len(data))
+        else:
+            chunk = os.read(fd, length - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+'''
+    Cheap check of whether a file changed: a hash of the file size and its first and
+    last sample_size bytes.
+'''
+def fingerprint(path, sample_size=DEFAULT_FINGERPRINT_SIZE):
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        size = os.fstat(fd).st_size
+        digest = hashlib.sha1((str(size) + "|" + str(sample_size) + "|").encode())
+        digest.update(__read_at(fd, min(size, sample_size), 0))
+        if size > sample_size:
+            tail_offset = max(sample_size, size - sample_size)
+            digest.update(__read_at(fd, size - tail_offset, tail_offset))
+    finally:
+        os.close(fd)
+    return digest.hexdigest()
+
+
+def check_for_ines_header(path):
+    with open(path, 'rb') as f:
+        header_tag = f.read(4)
+        return header_tag[0] == 0x4e and header_tag[1] == 0x45 and header_tag[2] == 0x53 and header_tag[3] == 0x1a
+
+
+'''
+    Groups items by the device their file is on (st_dev) and orders each group by
+    directory and inode, which is close to on-disk order on most filesystems.
+    Returns list of (device, [(item, size)]). Items that can't be stat'ed are
+    grouped under device None so the hash function reports the error.
+'''
+def order_by_device(items, path_fn=lambda item: item):
+    devices = collections.OrderedDict()
+    for item in items:
+        path = path_fn(item)
+        try:
+            stat = os.stat(path)
+            device, inode, size = stat.st_dev, stat.st_ino, stat.st_size
+        except OSError:
+            device, inode, size = None, 0, 0
+        devices.setdefault(device, []).append((os.path.dirname(path), inode, item, size))
+    return [(device, [(item, size) for directory, inode, item, size in sorted(entries, key=lambda entry: entry[:2])])
+        for device, entries in devices.items()]
+
+
+class DeviceQueue:
+
+    def __init__(self, entries, max_workers, tune):
+        self.entries = collections.deque(entries)
+        self.max_workers = max_workers
+        self.tuning = tune and max_workers > 1
+        self.workers = 0
+        self.lock = threading.Lock()
+        self.window_start = time.perf_counter()
+        self.window_bytes = 0
+        self.window_count = 0
+        self.last_throughput = None
+
+    def pop(self):
+        with self.lock:
+            return self.entries.popleft() if self.entries else None
+
+    '''
+    Records a finished item. Returns 1 to add a worker, -1 to retire the calling
+    worker, 0 otherwise.
+    '''
+    def record(self, size):
+        with self.lock:
+            if not self.tuning:
+                return 0
+            self.window_bytes += size
+            self.window_count += 1
+            if self.window_count < DeviceScheduler.TUNE_WINDOW:
+                return 0
+
+            elapsed = time.perf_counter() - self.window_start
+            throughput = self.window_bytes / elapsed if elapsed else 0
+            self.window_start = time.perf_counter()
+            self.window_bytes = 0
+            self.window_count = 0
+
+            if self.last_throughput is None or throughput > self.last_throughput * DeviceScheduler.TUNE_MIN_GAIN:
+                self.last_throughput = throughput
+                if self.workers < self.max_workers and self.entries:
+                    self.workers += 1
+                    return 1
+                self.tuning = False
+                return 0
+
+            # The last added worker didn't help (e.g. seeking on a hard drive)
+            self.tuning = False
+            if self.workers > 1:
+                self.workers -= 1
+                return -1
+            return 0
+
+
+'''
+    Runs fn over items with a separate set of workers per device, so reads from
+    several drives overlap without any one drive seeking between files.
+
+    With workers_per_device set, each device gets that many workers. With 0, each
+    device starts with one worker and adds more while throughput keeps improving,
+    up to max_workers. max_workers also caps the number of fn calls running at once.
+'''
+class DeviceScheduler:
+
+    TUNE_WINDOW = 8
+    TUNE_MIN_GAIN = 1.1
+
+    def __init__(self, max_workers=4, workers_per_device=0):
+        self.max_workers = max(1, max_workers)
+        self.workers_per_device = workers_per_device
+
+    '''
+    Yields (item, result, error) as items complete.
+    '''
+    def map(self, fn, items, path_fn=lambda item: item):
+        groups = order_by_device(items, path_fn)
+        count = sum(len(entries) for device, entries in groups)
+        results = queue.Queue()
+        running = threading.BoundedSemaphore(self.max_workers)
+        stopped = threading.Event()
+
+        def work(device_queue):
+            while not stopped.is_set():
+                entry = device_queue.pop()
+                if entry is None:
+                    return
+                item, size = entry
+                with running:
+                    try:
+                        results.put((item, fn(item), None))
+                    except Exception as e:
+                        results.put((item, None, e))
+                change = device_queue.record(size)
+                if change > 0:
+                    start(device_queue)
+                elif change < 0:
+                    return
+
+        def start(device_queue):
+            threading.Thread(target=work, args=(device_queue,), daemon=True).start()
+
+        for device, entries in groups:
+            if self.workers_per_device > 0:
+                device_queue = DeviceQueue(entries, self.workers_per_device, False)
+                device_queue.workers = min(self.workers_per_device, len(entries))
+            else:
+                device_queue = DeviceQueue(entries, self.max_workers, True)
+                device_queue.workers = 1
+            for i in range(device_queue.workers):
+                start(device_queue)
+
+        try:
+            for i in range(count):
+                yield results.get()
+        finally:
+            stopped.set()
+
+
+'''
+    CRCs keyed by path and offset, reused while the file's size and mtime are
+    unchanged. In FINGERPRINT mode, an entry whose mtime changed is still reused
+    if the file's size and fingerprint (see fingerprint()) match the ones stored
+    with it, e.g. after the file was touched or restored from a backup. A
+    fingerprint only decides whether a path's entry is stale, it never identifies
+    a file by itself. STRICT always reads the whole file. Can be saved to and
+    loaded from a JSON file.
+'''
+class CrcCache:
+
+    def __init__(self, mode=MTIME, sample_size=DEFAULT_FINGERPRINT_SIZE):
+        self.mode = mode
+        self.sample_size = sample_size
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.modified = False
+
+    @staticmethod
+    def __get_key(path, offset):
+        return path + "|" + str(offset)
+
+    def get_crc32(self, path, offset=0, mode=None):
+        return self.lookup(path, offset, mode)[0]
+
+    '''
+    Returns tuple of the CRC and whether it was taken from the cache rather than
+    by reading the whole file.
+    '''
+    def lookup(self, path, offset=0, mode=None):
+        mode = mode or self.mode
+        stat = os.stat(path)
+        key = CrcCache.__get_key(path, offset)
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry and mode != STRICT and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            return (entry["crc"], True)
+
+        cached = entry
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        if mode == FINGERPRINT:
+            entry["fingerprint"] = fingerprint(path, self.sample_size)
+            if cached and cached["size"] == stat.st_size and cached.get("fingerprint") == entry["fingerprint"]:
+                entry["crc"] = cached["crc"]
+                with self.lock:
+                    self.entries[key] = entry
+                    self.modified = True
+                return (entry["crc"], True)
+
+        entry["crc"] = crc32(path, offset)
+        with self.lock:
+            self.entries[key] = entry
+            self.modified = True
+        return (entry["crc"], False)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            self.entries.update(entries)
+
+    def save(self, path):
+        # Serialized so an older snapshot can't replace a newer one
+        with self.save_lock:
+            with self.lock:
+                if not self.modified:
+                    return
+                data = json.dumps(self.entries)
+                self.modified = False
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            atomic_write(path, data.encode('utf-8'))
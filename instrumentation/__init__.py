@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+
+PARSE = "parse"
+SCAN = "directory scan"
+HASH = "hashing"
+SERIAL = "serial extraction"
+RDB_LOAD = "rdb load"
+LOOKUP = "lookup"
+HTTP = "http fetch"
+WRITE = "write-back"
+
+BYTES_READ = "bytes read"
+FILES_OPENED = "files opened"
+SUBPROCESSES = "subprocesses spawned"
+HTTP_REQUESTS = "http requests"
+CRC_CACHE_HITS = "crc cache hits"
+
+
+class Phase:
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.instrumentation.add_time(self.name, time.perf_counter() - self.start)
+
+
+'''
+    Collects time spent per phase and I/O counters for a single command run.
+    Phases may nest, so phase times don't necessarily add up to the total.
+'''
+class Instrumentation:
+
+    enabled = True
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add_time(self, name, elapsed):
+        entry = self.phases.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        total = time.perf_counter() - self.start
+        lines = [self.name + " timings:"]
+        lines.append("phase".ljust(20) + "calls".rjust(10) + "total ms".rjust(12) + "avg ms".rjust(10) + "% run".rjust(8))
+        for name, entry in self.phases.items():
+            lines.append(name.ljust(20) + str(entry[0]).rjust(10) + \
+                ("%.1f" % (entry[1] * 1000)).rjust(12) + \
+                ("%.3f" % (entry[1] * 1000 / entry[0])).rjust(10) + \
+                ("%.1f" % (entry[1] * 100 / total if total else 0)).rjust(8))
+        lines.append("total".ljust(20) + "".rjust(10) + ("%.1f" % (total * 1000)).rjust(12))
+        for name, value in self.counters.items():
+            lines.append(name.ljust(20) + str(value).rjust(10))
+        return "\n".join(lines)
+
+
+class NullPhase:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+'''
+    Used when instrumentation is disabled so call sites don't need to check.
+'''
+class NullInstrumentation:
+
+    enabled = False
+
+    def __init__(self):
+        self.null_phase = NullPhase()
+
+    def phase(self, name):
+        return self.null_phase
+
+    def add_time(self, name, elapsed):
+        pass
+
+    def count(self, name, amount=1):
+        pass
+
+    def summary(self):
+        return ""
+
+
+NULL = NullInstrumentation()
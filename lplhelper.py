@@ -1,32 +1,180 @@
 import sublime
 import sublime_plugin
 import copy
+import functools
+import importlib
 import json
 import os
-import re
-import urllib.error
-import urllib.request
-import zlib
+import threading
+import time
 from collections import OrderedDict
-from urllib.parse import quote
 
-from . import rdb
-from . import serial
+from . import instrumentation
+from . import results
+from . import service
+
+
+'''
+    Stands in for a module and imports it on first attribute access, so loading the
+    plugin doesn't pay for modules a session may never use. Run
+    "python -m bench --only startup" to check what loading the plugin imports.
+'''
+class LazyModule:
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def __load(self):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name, __package__)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.__load(), attr)
+
+    def preload(self):
+        self.__load()
+
+
+archive = LazyModule(".archive")
+atomicfile = LazyModule(".atomicfile")
+convert = LazyModule(".convert")
+hashing = LazyModule(".hashing")
+m3u = LazyModule(".m3u")
+paths = LazyModule(".paths")
+rdb = LazyModule(".rdb")
+registry = LazyModule(".registry")
+serial = LazyModule(".serial")
+suggest = LazyModule(".suggest")
+thumbnails = LazyModule(".thumbnails")
+watch = LazyModule(".watch")
+service_client = LazyModule(".service.client")
+optimize = LazyModule(".thumbnails.optimize")
+
+cProfile = LazyModule("cProfile")
+futures = LazyModule("concurrent.futures")
+pstats = LazyModule("pstats")
+subprocess = LazyModule("subprocess")
+tempfile = LazyModule("tempfile")
+urllib_error = LazyModule("urllib.error")
+
+profile_next_run = False
+last_results = None
+helper_client = None
+crc_cache = None
+folder_watches = {}
+warmed_up = False
+
+
+def plugin_loaded():
+    settings = sublime.load_settings("LplHelper.sublime-settings")
+    if settings.get("rdb_cache_warm_on_load", False):
+        sublime.set_timeout_async(lambda: sublime.run_command("lpl_warm_rdb_cache"), 0)
+
+
+'''
+    Imports the modules the commands use on the calling thread, so the first
+    command run doesn't pay for it.
+'''
+def warm_up():
+    for module in (archive, hashing, m3u, paths, rdb, registry, serial, suggest, thumbnails):
+        module.preload()
+
+
+def plugin_unloaded():
+    for folder_watch in list(folder_watches.values()):
+        folder_watch.stop()
+
+
+def get_service_cache_dir():
+    return os.path.join(sublime.cache_path(), "LplHelper", "service")
+
+
+'''
+    Returns a client for the helper service when service_enabled is set and the
+    service is reachable, otherwise None so the caller does the work in-process.
+'''
+def get_helper_client():
+    global helper_client
+
+    settings = sublime.load_settings("LplHelper.sublime-settings")
+    if not settings.get("service_enabled", False):
+        return None
+    port = settings.get("service_port", service.DEFAULT_PORT)
+    token = settings.get("service_token", "") or service.read_token(get_service_cache_dir())
+    if helper_client and helper_client.port == port and helper_client.token == token:
+        return helper_client
+
+    client = service_client.Client(port, token)
+    try:
+        client.ping()
+    except (OSError, service_client.ServiceError) as e:
+        print("LplHelper service not available, running in-process: " + str(e))
+        return None
+    helper_client = client
+    return client
+
+
+'''
+    Decorator for command run methods. Closes the run's result output afterwards.
+
+    When instrumentation_enabled is set, also times each phase of the run and prints
+    a summary table to the console afterwards. If profiling was requested with
+    lpl_profile_next_run, the run is also profiled and the cProfile stats dumped to
+    instrumentation_profile_dir.
+'''
+def instrumented(run):
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        global profile_next_run
+
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        profile = profile_next_run
+        profile_next_run = False
+
+        if not profile and not settings.get("instrumentation_enabled", False):
+            self.metrics = instrumentation.NULL
+            try:
+                return run(self, *args, **kwargs)
+            finally:
+                self.close_results()
+
+        self.metrics = instrumentation.Instrumentation(type(self).__name__)
+        profiler = cProfile.Profile() if profile else None
+        try:
+            if profiler:
+                return profiler.runcall(run, self, *args, **kwargs)
+            return run(self, *args, **kwargs)
+        finally:
+            self.close_results()
+            print(self.metrics.summary())
+            if profiler:
+                profile_dir = settings.get("instrumentation_profile_dir", "") or tempfile.gettempdir()
+                profile_path = os.path.join(profile_dir, type(self).__name__ + "-" + time.strftime("%Y%m%d-%H%M%S") + ".prof")
+                profiler.dump_stats(profile_path)
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+                print("Profile written to " + profile_path)
+    return wrapper
+
 
 class LplBaseCommand:
 
     json_data = None
-    errors = []
-    warnings = []
+    results = None
+    errors = None
+    warnings = None
+    metrics = instrumentation.NULL
+    helper_client = None
 
     def get_full_region(self):
         return sublime.Region(0, self.view.size())
 
     def get_json_data(self):
         body = self.view.substr(self.get_full_region())
-        self.json_data = json.loads(body, object_pairs_hook=OrderedDict)
-        self.errors = []
-        self.warnings = []
+        with self.metrics.phase(instrumentation.PARSE):
+            self.json_data = json.loads(body, object_pairs_hook=OrderedDict)
+        self.init_results()
 
         if "items" not in self.json_data:
             msg = "No items found in file"
@@ -36,10 +184,11 @@ class LplBaseCommand:
         print("Starting...")
 
     def update_data(self, edit):
-        updated_data = json.dumps(self.json_data, indent=2, separators=(',', ': '))
-        updated_data += '\n'
+        with self.metrics.phase(instrumentation.WRITE):
+            updated_data = json.dumps(self.json_data, indent=2, separators=(',', ': '))
+            updated_data += '\n'
 
-        self.view.replace(edit, self.get_full_region(), updated_data)
+            self.view.replace(edit, self.get_full_region(), updated_data)
 
     def show_status_message(self, msg, print_to_console=True):
         if print_to_console:
@@ -47,14 +196,43 @@ class LplBaseCommand:
         sublime.status_message(msg)
         print('=' * 10)
 
+    def init_results(self):
+        global last_results
+
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        self.results = results.ResultCollector(settings.get("results_max_records", results.DEFAULT_MAX_RECORDS))
+        self.errors = self.results.errors
+        self.warnings = self.results.warnings
+        self.results_page_size = settings.get("results_page_size", 500)
+        self.results_dialog_max_lines = settings.get("results_dialog_max_lines", 20)
+
+        results_output_file = settings.get("results_output_file", "")
+        if results_output_file:
+            results_output_file = results.get_run_output_path(results_output_file)
+            try:
+                self.results.add_listener(results.FileSink(results_output_file, True))
+            except OSError as e:
+                print("Could not open results output file " + results_output_file + ": " + str(e))
+                sublime.status_message("Could not open results output file, see console.")
+
+        last_results = ResultPage(self.results, self.results_page_size)
+
+    def close_results(self):
+        if self.results:
+            self.results.close()
+
     def show_errors(self, msg, no_error_msg=None):
         if self.errors:
             status = str(len(self.errors)) + " " + msg
+            shown = list(self.results.get_results(results.ERROR, 0, self.results_dialog_max_lines))
             dialog = status + ":\n\n"
-            dialog += "\n".join(self.errors)
+            dialog += "\n".join(result.details for result in shown)
+            if len(shown) < len(self.errors):
+                dialog += "\n\n... and " + str(len(self.errors) - len(shown)) + " more, see the LplHelper output panel."
 
             print(dialog)
             self.show_status_message(status, False)
+            show_results_panel(self.get_window(), last_results)
             sublime.message_dialog(dialog)
         elif no_error_msg is not None:
             self.show_status_message(no_error_msg)
@@ -62,8 +240,36 @@ class LplBaseCommand:
     def show_warnings(self):
         if self.warnings:
             print("Found warnings:\n")
-            print('\n'.join(self.warnings))
+            print('\n'.join(result.details for result in self.results.get_results(results.WARNING, 0, self.results_page_size)))
+            if len(self.warnings) > self.results_page_size:
+                print("... and " + str(len(self.warnings) - self.results_page_size) + " more, see the LplHelper output panel.")
             print('-' * 10)
+            show_results_panel(self.get_window(), last_results)
+
+    def get_window(self):
+        return self.view.window()
+
+    def get_suggestion_count(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        return settings.get("suggestion_count", 3)
+
+    def get_registry(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        default_json = sublime.load_resource("Packages/" + __package__ + "/registry/systems.json")
+        return registry.get_registry(default_json, settings.get("system_registry", {}))
+
+    def init_helper_client(self):
+        self.helper_client = get_helper_client()
+
+    def helper_failed(self, e):
+        global helper_client
+
+        print("LplHelper service request failed, continuing in-process: " + str(e))
+        self.helper_client = None
+        helper_client = None
+
+    def get_m3u_members(self, m3u_path):
+        return m3u.get_cache().get_members(m3u_path)
 
     def get_current_playlist(self):
         current_file = os.path.basename(self.view.window().active_view().file_name())
@@ -77,6 +283,7 @@ class LplSortCommand(LplBaseCommand, sublime_plugin.TextCommand):
     def sorter(self, value):
         return value["label"].lower()
 
+    @instrumented
     def run(self, edit):
         self.get_json_data()
 
@@ -95,32 +302,32 @@ class LplMissingEntriesBaseCommand(LplBaseCommand):
         self.name_exclusions = settings.get("name_exclusions", [])
         self.extension_exclusions = settings.get("extension_exclusions", [])
 
+    def is_excluded(self, name):
+        return name in self.name_exclusions or os.path.splitext(name)[1] in self.extension_exclusions
+
+    def get_folders(self):
+        return set(os.path.dirname(item["path"]) for item in self.json_data["items"])
+
     def find_missing(self):
-        folders = set()
-        existing_items = set()
-        for item in self.json_data["items"]:
-            folders.add(os.path.dirname(item["path"]))
-            existing_items.add(item["path"])
+        folders = self.get_folders()
+        existing_items = set(item["path"] for item in self.json_data["items"])
 
         found_items = set()
 
-        for folder in folders:
-            current_folder = set([os.path.join(folder, f) for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))
-                and f not in self.name_exclusions
-                and os.path.splitext(f)[1] not in self.extension_exclusions])
+        with self.metrics.phase(instrumentation.SCAN):
+            for folder in folders:
+                current_folder = set([os.path.join(folder, f) for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))
+                    and not self.is_excluded(f)])
 
-            included_in_m3u = []
-            for item in current_folder:
-                if os.path.splitext(item)[1] != ".m3u":
-                    continue
-                with open(item) as file:
-                    for line in file:
-                        included_in_m3u.append(os.path.join(folder, line.rstrip()))
+                included_in_m3u = []
+                for item in current_folder:
+                    if os.path.splitext(item)[1] != m3u.EXTENSION:
+                        continue
+                    included_in_m3u += self.get_m3u_members(item)
 
-            for item in included_in_m3u:
-                current_folder.remove(item)
+                current_folder.difference_update(included_in_m3u)
 
-            found_items.update(current_folder)
+                found_items.update(current_folder)
 
         self.missing_items = found_items - existing_items
 
@@ -135,21 +342,24 @@ class LplMissingEntriesBaseCommand(LplBaseCommand):
             new_entry["path"] = missing
             new_entry["label"] = os.path.splitext(os.path.basename(missing))[0]
             self.json_data["items"].insert(0, new_entry)
-            self.errors.append("Entry added for \'" + missing + "\'")
+            self.errors.add("Entry added for \'" + missing + "\'", "ADDED", None, new_entry["label"])
 
 
 class LplFindMissingEntriesCommand(LplMissingEntriesBaseCommand, sublime_plugin.TextCommand):
 
+    @instrumented
     def run(self, edit):
         self.init_exclusions()
         self.get_json_data()
         self.find_missing()
-        self.errors = self.missing_items
+        for missing in sorted(self.missing_items):
+            self.errors.add(missing, "MISSING", None, os.path.splitext(os.path.basename(missing))[0])
         self.show_errors("missing item(s) found", "No missing items found.")
 
 
 class LplAddMissingEntriesCommand(LplMissingEntriesBaseCommand, sublime_plugin.TextCommand):
 
+    @instrumented
     def run(self, edit):
         self.init_exclusions()
         self.get_json_data()
@@ -162,14 +372,47 @@ class LplAddMissingEntriesCommand(LplMissingEntriesBaseCommand, sublime_plugin.T
 
 class LplValidatePathsCommand(LplBaseCommand, sublime_plugin.TextCommand):
 
+    @instrumented
     def run(self, edit):
         self.get_json_data()
-
-        for item in self.json_data["items"]:
-            if not os.path.isfile(item["path"]):
-                self.errors += [item["path"]]
-            if os.path.splitext(os.path.basename(item["path"]))[0] != item["label"]:
-                self.warnings.append("[LABEL] " + item["label"] + " is inconsistent with [PATH] " + os.path.splitext(os.path.basename(item["path"]))[0])
+        path_index = paths.PathIndex()
+        missing_directories = OrderedDict()
+        unreadable_directories = OrderedDict()
+
+        with self.metrics.phase(instrumentation.SCAN):
+            for index, item in enumerate(self.json_data["items"]):
+                path = item["path"]
+                result, found = path_index.check(path)
+                if result == paths.MISSING_DIRECTORY:
+                    missing_directories.setdefault(found, []).append((index, item))
+                elif result == paths.UNREADABLE_DIRECTORY:
+                    unreadable_directories.setdefault(found, []).append((index, item))
+                elif result == paths.CASE_MISMATCH:
+                    actual_path = os.path.join(os.path.dirname(path), found[0])
+                    # Case-insensitive filesystems still open the file, but it breaks on other platforms
+                    if os.path.isfile(path):
+                        self.warnings.add("[CASE] " + path + " only matches " + actual_path + " ignoring case", "CASE", index, item["label"])
+                    else:
+                        self.errors.add("[CASE] " + path + " only matches " + actual_path + " ignoring case", "CASE", index, item["label"])
+                elif result != paths.FOUND:
+                    self.errors.add(path, "PATH", index, item["label"])
+
+                file_label = os.path.splitext(os.path.basename(path))[0]
+                if file_label != item["label"]:
+                    self.warnings.add("[LABEL] " + item["label"] + " is inconsistent with [PATH] " + file_label, "LABEL", index, item["label"])
+
+            for directory, items in missing_directories.items():
+                index, item = items[0]
+                message = "[DIRECTORY] " + directory + " doesn't exist (" + str(len(items)) + " item(s))"
+                actual_directory = path_index.find_directory_case_mismatch(directory)
+                if actual_directory:
+                    message += ", but " + actual_directory + " does (case mismatch)"
+                self.errors.add(message, "DIRECTORY", index, item["label"])
+
+            for directory, items in unreadable_directories.items():
+                index, item = items[0]
+                message = "[DIRECTORY] " + directory + " could not be read due to: " + str(path_index.errors[directory]) + " (" + str(len(items)) + " item(s))"
+                self.errors.add(message, "DIRECTORY", index, item["label"])
 
         self.show_warnings()
         self.show_errors("invalid path(s) found", "All paths valid.")
@@ -177,25 +420,107 @@ class LplValidatePathsCommand(LplBaseCommand, sublime_plugin.TextCommand):
 
 class LplCrcBaseCommand(LplBaseCommand):
 
+    prefetched_crcs = {}
+    prefetched_headers = {}
+    crc_cache = None
+
     @staticmethod
     def crc32(path, offset=0):
-        crc = 0
+        return hashing.crc32(path, offset)
+
+    def get_crc_cache_file(self):
+        return os.path.join(sublime.cache_path(), "LplHelper", "crc_cache.json")
 
-        with open(path, 'rb', 65536) as f:
-            f.seek(offset)
-            for x in range(int((os.stat(path).st_size / 65536)) + 1):
-                crc = zlib.crc32(f.read(65536), crc)
-        return '%08X' % (crc & 0xFFFFFFFF)
+    '''
+    Sets up the CRC cache for the run according to crc_cache_mode. With "strict"
+    there's no cache and every file is read in full.
+    '''
+    def init_crc_cache(self):
+        global crc_cache
+
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        self.crc_cache_mode = settings.get("crc_cache_mode", hashing.STRICT)
+        if self.crc_cache_mode == hashing.STRICT:
+            self.crc_cache = None
+            return
+        if crc_cache is None:
+            crc_cache = hashing.CrcCache()
+            crc_cache.load(self.get_crc_cache_file())
+        crc_cache.mode = self.crc_cache_mode
+        crc_cache.sample_size = int(settings.get("crc_fingerprint_mb", 1) * 1024 * 1024)
+        self.crc_cache = crc_cache
+
+    def save_crc_cache(self):
+        if self.crc_cache:
+            self.crc_cache.save(self.get_crc_cache_file())
+
+    '''
+    Thread-safe; uses the CRC cache when there is one. Returns tuple of crc32 and
+    whether it came from the cache.
+    '''
+    def lookup_crc32(self, path, offset=0):
+        if self.crc_cache:
+            return self.crc_cache.lookup(path, offset)
+        return (LplCrcBaseCommand.crc32(path, offset), False)
+
+    def get_crc32(self, path, offset=0):
+        return self.lookup_crc32(path, offset)[0]
+
+    '''
+    Counts a CRC as a cache hit, or as a full read of the file from offset.
+    '''
+    def count_crc(self, path, offset, cached):
+        if cached:
+            self.metrics.count(instrumentation.CRC_CACHE_HITS)
+            return
+        self.metrics.count(instrumentation.FILES_OPENED)
+        self.metrics.count(instrumentation.BYTES_READ, max(0, os.path.getsize(path) - offset))
+
+    def calculate_crc(self, path, offset=0):
+        crc = self.prefetched_crcs.get((path, offset))
+        if crc is not None:
+            return crc
+
+        if self.helper_client:
+            try:
+                with self.metrics.phase(instrumentation.HASH):
+                    index, crc, error = list(self.helper_client.crc32([(path, offset)], self.crc_cache_mode))[0]
+            except (OSError, service_client.ServiceError) as e:
+                self.helper_failed(e)
+            else:
+                if error:
+                    raise Exception(error)
+                return crc
+
+        with self.metrics.phase(instrumentation.HASH):
+            crc, cached = self.lookup_crc32(path, offset)
+        self.count_crc(path, offset, cached)
+        return crc
+
+    def calculate_archive_crc(self, path):
+        with self.metrics.phase(instrumentation.HASH):
+            crc = archive.get_crc32(path, self.get_archive_verify())
+        self.metrics.count(instrumentation.FILES_OPENED)
+        return crc
+
+    def get_archive_verify(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        return settings.get("archive_verify_crcs", False)
 
-    def get_serial(self, path):
+    def get_serial(self, path, serial_strategy):
         settings = sublime.load_settings("LplHelper.sublime-settings")
         chd_serial_path = settings.get("chd_serial_path", "")
-        return serial.get_serial(path, self.get_current_playlist(), chd_serial_path)
+        if serial_strategy == "chd":
+            self.metrics.count(instrumentation.SUBPROCESSES)
+        else:
+            self.metrics.count(instrumentation.FILES_OPENED)
+        with self.metrics.phase(instrumentation.SERIAL):
+            return serial.get_serial(path, serial_strategy, chd_serial_path)
 
-    def compare_crcs(self, existing_crc, file_crc, rom_crc, extension, label):
-        if extension == ".nes":
+    def compare_crcs(self, existing_crc, file_crc, rom_crc, label):
+        if rom_crc is not None:
             if existing_crc == file_crc:
-                self.warnings.append("[COMPARE .nes] " + label + ": existing CRC (" + existing_crc + ") matches with FILE CRC (" + file_crc + ") instead of ROM CRC (" + rom_crc + ")")
+                self.warnings.add("[COMPARE .nes] " + label + ": existing CRC (" + existing_crc + ") matches with FILE CRC (" + file_crc + ") instead of ROM CRC (" + rom_crc + ")", "COMPARE")
                 return False
             if existing_crc == rom_crc:
                 return True
@@ -204,23 +529,171 @@ class LplCrcBaseCommand(LplBaseCommand):
         return existing_crc == file_crc
 
     def check_for_ines_header(self, path):
-        with open(path, 'rb') as f:
-            header_tag = f.read(4)
-            return header_tag[0] == 0x4e and header_tag[1] == 0x45 and header_tag[2] == 0x53 and header_tag[3] == 0x1a
+        has_header = self.prefetched_headers.get(path)
+        if has_header is not None:
+            return has_header
+
+        self.metrics.count(instrumentation.FILES_OPENED)
+        self.metrics.count(instrumentation.BYTES_READ, 4)
+        return hashing.check_for_ines_header(path)
+
+    def get_device_scheduler(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        return hashing.DeviceScheduler(settings.get("hash_workers", 4), settings.get("hash_workers_per_device", 0))
+
+    '''
+    Runs on a worker thread. Returns tuple of iNES header flag (None if not checked),
+    offset, crc32 and whether the crc32 came from the cache.
+    '''
+    def hash_for_strategy(self, path, hash_strategy):
+        if hash_strategy == registry.HashStrategy.INES:
+            if hashing.check_for_ines_header(path):
+                return (True, 0x10) + self.lookup_crc32(path, 0x10)
+            return (False, 0) + self.lookup_crc32(path)
+        return (None, 0) + self.lookup_crc32(path)
+
+    '''
+    Hashes the playlist's plain and iNES files in parallel (or in one helper service
+    request) before validate_crcs walks the items. Files that fail here are hashed
+    again in order so the error is reported where it was before.
+    '''
+    def prefetch_crcs(self, hash_plan, update_crcs):
+        self.prefetched_crcs = {}
+        self.prefetched_headers = {}
+
+        files = OrderedDict()
+        for item in self.json_data["items"]:
+            hash_strategy = hash_plan.get(os.path.splitext(item["path"])[1], registry.HashStrategy.CRC)
+            if hash_strategy not in (registry.HashStrategy.CRC, registry.HashStrategy.INES):
+                continue
+            if update_crcs == False and item["crc32"] == "DETECT":
+                continue
+            files[item["path"]] = hash_strategy
+
+        if self.helper_client and self.prefetch_service_crcs(files):
+            return
+
+        with self.metrics.phase(instrumentation.HASH):
+            hash_item = lambda path: self.hash_for_strategy(path, files[path])
+            for path, result, error in self.get_device_scheduler().map(hash_item, list(files)):
+                if error:
+                    continue
+                has_header, offset, crc, cached = result
+                if has_header is not None:
+                    self.prefetched_headers[path] = has_header
+                self.prefetched_crcs[(path, offset)] = crc
+                self.count_crc(path, offset, cached)
+
+    '''
+    Asks the helper service for the CRCs of all files in a single request. iNES
+    headers are checked here to pick the offset. Returns False if the service
+    failed, so the files can be hashed in-process.
+    '''
+    def prefetch_service_crcs(self, files):
+        requests = []
+        for path, hash_strategy in files.items():
+            offset = 0
+            if hash_strategy == registry.HashStrategy.INES:
+                try:
+                    has_header = self.check_for_ines_header(path)
+                except Exception:
+                    continue
+                self.prefetched_headers[path] = has_header
+                offset = 0x10 if has_header else 0
+            requests.append((path, offset))
+
+        try:
+            with self.metrics.phase(instrumentation.HASH):
+                for index, crc, error in self.helper_client.crc32(requests, self.crc_cache_mode):
+                    if not error:
+                        self.prefetched_crcs[requests[index]] = crc
+        except (OSError, service_client.ServiceError) as e:
+            self.helper_failed(e)
+            return False
+        return True
+
+    '''
+    Sets up hash_item for files of the given system.
+    '''
+    def init_hashing(self, system):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        self.system = system
+        self.chd_serial_path = settings.get("chd_serial_path", "")
+        self.archive_verify = self.get_archive_verify()
+        self.init_crc_cache()
+
+        system_registry = self.get_registry()
+        self.hash_plan = system_registry.get_hash_plan(system)
+        self.serial_strategy = system_registry.serial_by_system.get(system_registry.get_system(system))
+
+    '''
+    Runs on a worker thread. Returns the crc32 field value for the file.
+    '''
+    def hash_item(self, path):
+        hash_strategy = self.hash_plan.get(os.path.splitext(path)[1], registry.HashStrategy.CRC)
+        if hash_strategy in (registry.HashStrategy.M3U, registry.HashStrategy.SKIP):
+            return "DETECT"
+        if hash_strategy == registry.HashStrategy.SERIAL:
+            if self.serial_strategy is None:
+                raise Exception("No serial support for system " + self.system)
+            return serial.get_serial(path, self.serial_strategy, self.chd_serial_path) + "|serial"
+        if hash_strategy == registry.HashStrategy.ARCHIVE:
+            return archive.get_crc32(path, self.archive_verify) + "|crc"
+        return self.hash_for_strategy(path, hash_strategy)[2] + "|crc"
+
+    '''
+    Hashes (or serial probes) the given m3u discs in parallel. Discs listed by
+    several m3u files are only hashed once. Returns dict of disc path to tuple of
+    crc32 field value and error. Needs init_hashing.
+    '''
+    def hash_m3u_discs(self, discs):
+        disc_results = {}
+        with self.metrics.phase(instrumentation.HASH):
+            for path, crc32, error in self.get_device_scheduler().map(self.hash_item, list(OrderedDict.fromkeys(discs))):
+                disc_results[path] = (crc32, error)
+        return disc_results
+
+    def check_m3u_discs(self, index, item):
+        try:
+            discs = self.get_m3u_members(item["path"])
+        except OSError as e:
+            self.warnings.add("[.M3U] " + item["label"] + " could not be read due to: " + str(e), "M3U", index, item["label"])
+            return
+        if not discs:
+            self.warnings.add("[.M3U] " + item["label"] + " doesn't list any discs", "M3U", index, item["label"])
+        for disc in discs:
+            if not os.path.isfile(disc):
+                self.warnings.add("[.M3U] " + item["label"] + ": disc " + disc + " doesn't exist", "M3U", index, item["label"])
 
     def validate_crcs(self, update_crcs=False):
+        self.init_helper_client()
+        self.init_crc_cache()
+        try:
+            return self.validate_items_crcs(update_crcs)
+        finally:
+            self.save_crc_cache()
+
+    def validate_items_crcs(self, update_crcs):
         modified = False
 
-        for item in self.json_data["items"]:
+        current_playlist = self.get_current_playlist()
+        system_registry = self.get_registry()
+        hash_plan = system_registry.get_hash_plan(current_playlist)
+        serial_strategy = None
+        self.prefetch_crcs(hash_plan, update_crcs)
+
+        for index, item in enumerate(self.json_data["items"]):
             extension = os.path.splitext(item["path"])[1]
+            hash_strategy = hash_plan.get(extension, registry.HashStrategy.CRC)
 
-            if extension == ".m3u":
+            if hash_strategy == registry.HashStrategy.M3U:
                 if item["crc32"] != "DETECT":
-                    self.warnings.append("[.M3U] " + item["label"] + " doesn't have DETECT")
+                    self.warnings.add("[.M3U] " + item["label"] + " doesn't have DETECT", "M3U", index, item["label"])
+                self.check_m3u_discs(index, item)
                 continue
 
             if update_crcs == False and item["crc32"] == "DETECT":
-                self.warnings.append("[CRC] " + item["label"] + " has no CRC")
+                self.warnings.add("[CRC] " + item["label"] + " has no CRC", "CRC", index, item["label"])
                 continue
 
             if not item["crc32"] == "DETECT" and (not item["crc32"].endswith("|crc") and not item["crc32"].endswith("|serial")):
@@ -232,28 +705,30 @@ class LplCrcBaseCommand(LplBaseCommand):
             else:
                 existing_crc_type = None
 
-            # Handle CHD / RVZ (uses serial)
-            if extension == ".chd" or extension == ".rvz":
-                # These are not currently supported
-                if self.get_current_playlist() == "NEC - PC-FX" or self.get_current_playlist() == "NEC - PC Engine CD - TurboGrafx-CD":
-                    continue
+            # Not currently supported for this system
+            if hash_strategy == registry.HashStrategy.SKIP:
+                continue
 
+            # Handle CHD / RVZ (uses serial)
+            if hash_strategy == registry.HashStrategy.SERIAL:
                 try:
-                    serial = self.get_serial(item["path"])
+                    if serial_strategy is None:
+                        serial_strategy = system_registry.get_serial_strategy(current_playlist)
+                    serial = self.get_serial(item["path"], serial_strategy)
                 except Exception as e:
-                    self.warnings.append("[SKIPPING] " + item["label"] + " could not get serial due to: " + str(e))
+                    self.warnings.add("[SKIPPING] " + item["label"] + " could not get serial due to: " + str(e), "SKIPPING", index, item["label"])
                     continue
 
                 if existing_crc_type != "serial" or serial != existing_crc:
                     if existing_crc_type and existing_crc_type != "serial":
-                        self.warnings.append(item["label"] + ": should have suffix \'|serial\'")
+                        self.warnings.add(item["label"] + ": should have suffix \'|serial\'", "SUFFIX", index, item["label"])
 
                     if update_crcs == False:
-                        self.errors.append(item["label"] + ": " + existing_crc + " vs " + serial + " (existing vs calculated)")
+                        self.errors.add(item["label"] + ": " + existing_crc + " vs " + serial + " (existing vs calculated)", "CRC", index, item["label"])
                     else:
                         modified = True
                         item["crc32"] = serial + "|serial"
-                        self.errors.append(item["label"] + ": CRC updated from " + existing_crc + " to " + item["crc32"][:-7])
+                        self.errors.add(item["label"] + ": CRC updated from " + existing_crc + " to " + item["crc32"][:-7], "UPDATED", index, item["label"])
                 continue
 
             # Handle everything else with regular CRC
@@ -262,35 +737,43 @@ class LplCrcBaseCommand(LplBaseCommand):
             use_rom_crc = False
 
             # check if NES and get alternate crc32 without header
-            if extension == ".nes":
+            if hash_strategy == registry.HashStrategy.INES:
                 if self.check_for_ines_header(item["path"]):
                     use_rom_crc = True
-                    rom_crc = LplCrcBaseCommand.crc32(item["path"], 0x10)
+                    rom_crc = self.calculate_crc(item["path"], 0x10)
                 else:
-                    self.warnings.append("[HEADER] " + item["label"] + " has no header")
-                    file_crc = LplCrcBaseCommand.crc32(item["path"])
+                    self.warnings.add("[HEADER] " + item["label"] + " has no header", "HEADER", index, item["label"])
+                    file_crc = self.calculate_crc(item["path"])
+            # Use CRC of the file inside the archive instead of the archive itself
+            elif hash_strategy == registry.HashStrategy.ARCHIVE:
+                try:
+                    file_crc = self.calculate_archive_crc(item["path"])
+                except Exception as e:
+                    self.warnings.add("[SKIPPING] " + item["label"] + " could not get archive CRC due to: " + str(e), "SKIPPING", index, item["label"])
+                    continue
             else:
-                file_crc = LplCrcBaseCommand.crc32(item["path"])
+                file_crc = self.calculate_crc(item["path"])
 
-            if existing_crc_type != "crc" or not self.compare_crcs(existing_crc, file_crc, rom_crc, extension, item["label"]):
+            if existing_crc_type != "crc" or not self.compare_crcs(existing_crc, file_crc, rom_crc, item["label"]):
                 if use_rom_crc:
                     file_crc = rom_crc
 
                 if existing_crc_type and existing_crc_type != "crc":
-                    self.warnings.append(item["label"] + ": should have suffix \'|crc\'")
+                    self.warnings.add(item["label"] + ": should have suffix \'|crc\'", "SUFFIX", index, item["label"])
 
                 if update_crcs == False:
-                    self.errors.append(item["label"] + ": " + existing_crc + " vs " + file_crc + " (existing vs calculated)")
+                    self.errors.add(item["label"] + ": " + existing_crc + " vs " + file_crc + " (existing vs calculated)", "CRC", index, item["label"])
                 else:
                     modified = True
                     item["crc32"] = file_crc + "|crc"
-                    self.errors.append(item["label"] + ": CRC updated from " + existing_crc + " to " + item["crc32"][:-4])
+                    self.errors.add(item["label"] + ": CRC updated from " + existing_crc + " to " + item["crc32"][:-4], "UPDATED", index, item["label"])
 
         return modified
 
 
 class LplValidateCrcCommand(LplCrcBaseCommand, sublime_plugin.TextCommand):
 
+    @instrumented
     def run(self, edit):
         self.get_json_data()
         self.validate_crcs(update_crcs=False)
@@ -300,6 +783,7 @@ class LplValidateCrcCommand(LplCrcBaseCommand, sublime_plugin.TextCommand):
 
 class LplUpdateCrcCommand(LplCrcBaseCommand, sublime_plugin.TextCommand):
 
+    @instrumented
     def run(self, edit):
         self.get_json_data()
         if self.validate_crcs(update_crcs=True):
@@ -310,6 +794,68 @@ class LplUpdateCrcCommand(LplCrcBaseCommand, sublime_plugin.TextCommand):
 
 class LplDatabaseCheckCrcCommand(LplCrcBaseCommand, sublime_plugin.TextCommand):
 
+    def get_rdbs(self):
+        if self.rdbs is None:
+            with self.metrics.phase(instrumentation.RDB_LOAD):
+                self.rdbs = rdb.load_rdbs(self.retroarch_rdb_path, self.rdb_systems)
+        return self.rdbs
+
+    def find_game(self, name, crc):
+        if self.helper_client:
+            try:
+                return self.helper_client.find_game(self.retroarch_rdb_path, self.rdb_systems, name, crc, self.current_playlist)
+            except (OSError, service_client.ServiceError) as e:
+                self.helper_failed(e)
+        return rdb.find_game_in_rdbs(self.get_rdbs(), name, crc, self.current_playlist)
+
+    def get_local_suggestions(self, name, count):
+        suggestions = []
+        for database in self.get_rdbs().values():
+            index = suggest.get_index(database, "names", lambda database=database: [game.name for game in database.games])
+            suggestions += index.query(name, count)
+        return sorted(suggestions, key=lambda pair: pair[1], reverse=True)[:count]
+
+    def get_suggestions_message(self, name):
+        count = self.get_suggestion_count()
+        if count <= 0:
+            return ""
+        with self.metrics.phase(instrumentation.LOOKUP):
+            suggestions = None
+            if self.helper_client:
+                try:
+                    suggestions = self.helper_client.suggest_names(self.retroarch_rdb_path, self.rdb_systems, name, count)
+                except (OSError, service_client.ServiceError) as e:
+                    self.helper_failed(e)
+            if suggestions is None:
+                suggestions = self.get_local_suggestions(name, count)
+        if not suggestions:
+            return ""
+        return " Closest names: " + suggest.format_suggestions(suggestions)
+
+    '''
+    Matches each disc of an m3u entry against the databases by its own file name.
+    '''
+    def check_discs(self, index, item, discs, disc_results):
+        name = item["label"]
+        for disc in discs:
+            disc_name = os.path.splitext(os.path.basename(disc))[0]
+            crc32, error = disc_results.get(disc, (None, None))
+            if error:
+                self.warnings.add("M3U: " + name + " disc " + disc_name + " could not be hashed due to: " + str(error), "M3U", index, name)
+                continue
+            if not crc32 or crc32 == "DETECT":
+                continue
+            crc = crc32.split('|')[0]
+            with self.metrics.phase(instrumentation.LOOKUP):
+                result = self.find_game(disc_name, crc)
+            if result[0] == rdb.SearchResult.CRC_MATCH_ONLY:
+                self.warnings.add("CRC MATCH ONLY: " + name + " disc " + disc_name + " with CRC " + crc + " didn't match name found in database (" + result[1] + ").", "CRC MATCH ONLY", index, name)
+            elif result[0] == rdb.SearchResult.NAME_MATCH_ONLY:
+                self.errors.add("NAME MATCH ONLY: " + name + " disc " + disc_name + " with CRC " + crc + " didn't match CRC found in database (" + result[1] + ").", "NAME MATCH ONLY", index, name)
+            elif result[0] == rdb.SearchResult.NOT_FOUND:
+                self.warnings.add("MISSING: " + name + " disc " + disc_name + " with CRC " + crc + " not found in database.", "MISSING", index, name)
+
+    @instrumented
     def run(self, edit):
         settings = sublime.load_settings("LplHelper.sublime-settings")
         retroarch_rdb_path = settings.get("retroarch_rdb_path", "")
@@ -317,36 +863,550 @@ class LplDatabaseCheckCrcCommand(LplCrcBaseCommand, sublime_plugin.TextCommand):
         if not retroarch_rdb_path:
             return
 
+        rdb.configure_cache(settings.get("rdb_cache_max_mb", rdb.DEFAULT_CACHE_MAX_MB))
         self.get_json_data()
-        current_playlist = self.get_current_playlist()
+        self.init_helper_client()
+        self.retroarch_rdb_path = retroarch_rdb_path
+        self.current_playlist = self.get_current_playlist()
+        system_registry = self.get_registry()
+        hash_plan = system_registry.get_hash_plan(self.current_playlist)
+        archive_verify = self.get_archive_verify()
 
         extensions = set()
-        for item in self.json_data["items"]:
+        archive_members = {}
+        m3u_discs = {}
+        for index, item in enumerate(self.json_data["items"]):
+            extension = os.path.splitext(item["path"])[1]
+            if hash_plan.get(extension) == registry.HashStrategy.M3U:
+                if settings.get("m3u_check_discs", False) and os.path.isfile(item["path"]):
+                    try:
+                        discs = self.get_m3u_members(item["path"])
+                    except OSError as e:
+                        self.warnings.add("[.M3U] " + item["label"] + " could not be read due to: " + str(e), "M3U", index, item["label"])
+                        continue
+                    # Only discs with a database of their own, not cue sheets or nested m3u files
+                    m3u_discs[index] = [disc for disc in discs if system_registry.has_rdb_systems(os.path.splitext(disc)[1])]
+                    extensions.update(os.path.splitext(disc)[1] for disc in m3u_discs[index])
+                continue
             if item["crc32"] == "DETECT":
                 continue
-            extensions.add(os.path.splitext(item["path"])[1])
+            extensions.add(extension)
 
-        rdbs = rdb.load_rdbs(retroarch_rdb_path, extensions)
-        for item in self.json_data["items"]:
+            # Archive members are also matched against the databases for their own extension
+            if hash_plan.get(extension) == registry.HashStrategy.ARCHIVE and archive.is_supported(item["path"]):
+                try:
+                    self.metrics.count(instrumentation.FILES_OPENED)
+                    with self.metrics.phase(instrumentation.HASH):
+                        members = archive.get_members(item["path"], archive_verify)
+                except Exception as e:
+                    self.warnings.add("ARCHIVE: " + item["label"] + " could not be read due to: " + str(e), "ARCHIVE", index, item["label"])
+                    continue
+                archive_members[item["path"]] = members
+                for member in members:
+                    member_extension = os.path.splitext(member.name)[1]
+                    if system_registry.has_rdb_systems(member_extension):
+                        extensions.add(member_extension)
+
+        disc_results = {}
+        if m3u_discs:
+            self.init_hashing(self.current_playlist)
+            try:
+                disc_results = self.hash_m3u_discs(disc for discs in m3u_discs.values() for disc in discs)
+            finally:
+                self.save_crc_cache()
+
+        self.rdb_systems = system_registry.get_rdb_systems_for_extensions(extensions)
+        self.rdbs = None
+        if not self.helper_client:
+            self.get_rdbs()
+
+        for index, item in enumerate(self.json_data["items"]):
+            if index in m3u_discs:
+                self.check_discs(index, item, m3u_discs[index], disc_results)
+                continue
             if item["crc32"] == "DETECT":
                 continue
             name = item["label"]
             crc = item["crc32"].split('|')[0]
-            result = rdb.find_game_in_rdbs(rdbs, name, crc, current_playlist)
+            with self.metrics.phase(instrumentation.LOOKUP):
+                result = self.find_game(name, crc)
+                for member in archive_members.get(item["path"], []):
+                    if result[0] == rdb.SearchResult.FOUND:
+                        break
+                    member_result = self.find_game(name, member.crc32)
+                    result = member_result if member_result[0] < result[0] else result
             if result[0] != rdb.SearchResult.FOUND:
                 if result[0] == rdb.SearchResult.CRC_MATCH_ONLY:
-                    self.warnings.append("CRC MATCH ONLY: "+ name + " with CRC " + crc + " didn't match name found in database (" + result[1] + ").")
+                    self.warnings.add("CRC MATCH ONLY: "+ name + " with CRC " + crc + " didn't match name found in database (" + result[1] + ").", "CRC MATCH ONLY", index, name)
                 elif result[0] == rdb.SearchResult.NAME_MATCH_ONLY:
-                    self.errors.append("NAME MATCH ONLY: " + name + " with CRC " + crc + " didn't match CRC found in database (" + result[1] + ").")
+                    self.errors.add("NAME MATCH ONLY: " + name + " with CRC " + crc + " didn't match CRC found in database (" + result[1] + ").", "NAME MATCH ONLY", index, name)
                 elif "(English)" in name:
-                    self.warnings.append("PATCH: " + name + " with CRC " + crc + " not found in database (English patch).")
+                    self.warnings.add("PATCH: " + name + " with CRC " + crc + " not found in database (English patch)." + self.get_suggestions_message(name), "PATCH", index, name)
                 else:
-                    self.warnings.append("MISSING: " + name + " with CRC " + crc + " not found in database.")
+                    self.warnings.add("MISSING: " + name + " with CRC " + crc + " not found in database." + self.get_suggestions_message(name), "MISSING", index, name)
 
         self.show_warnings()
         self.show_errors("non-matching CRC(s) found", "All CRCs match with database.")
 
 
+'''
+    Watches the ROM folders of a playlist view on a background thread. Added files
+    are hashed as they arrive, and each batch of changes is applied to the view once
+    the folders have been quiet for a poll.
+'''
+class FolderWatch:
+
+    def __init__(self, view, folders, playlist):
+        self.view = view
+        self.folders = folders
+        self.playlist = playlist
+        self.scanner = LplMissingEntriesBaseCommand()
+        self.hasher = LplCrcBaseCommand()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+
+    def start(self):
+        folder_watches[self.view.id()] = self
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        folder_watches.pop(self.view.id(), None)
+
+    def watch(self):
+        watcher = None
+        try:
+            settings = sublime.load_settings("LplHelper.sublime-settings")
+            self.scanner.init_exclusions()
+            self.hasher.init_hashing(self.playlist)
+            interval = settings.get("watch_poll_interval", 2)
+            watcher = watch.create_watcher(self.folders, settings.get("watch_use_inotify", True))
+
+            added = OrderedDict()
+            removed = set()
+            while not self.stopped.is_set():
+                changes = watcher.poll(interval)
+                for change, path in changes:
+                    if self.scanner.is_excluded(os.path.basename(path)):
+                        continue
+                    if change == watch.ADDED:
+                        removed.discard(path)
+                        added[path] = True
+                    else:
+                        added.pop(path, None)
+                        removed.add(path)
+                if changes or not (added or removed) or self.stopped.is_set():
+                    continue
+                try:
+                    self.apply(list(added), sorted(removed))
+                except Exception as e:
+                    print("Could not apply ROM folder changes: " + str(e))
+                added.clear()
+                removed.clear()
+        except Exception as e:
+            print("Stopped watching ROM folders due to: " + str(e))
+            sublime.status_message("Stopped watching ROM folders, see console.")
+        finally:
+            if watcher:
+                watcher.close()
+            self.hasher.save_crc_cache()
+            if folder_watches.get(self.view.id()) is self:
+                del folder_watches[self.view.id()]
+
+    def apply(self, added, removed):
+        # Discs listed in an m3u are covered by the m3u's entry
+        included_in_m3u = set()
+        for folder in set(os.path.dirname(path) for path in added):
+            try:
+                names = os.listdir(folder)
+            except OSError as e:
+                print("Could not list " + folder + ": " + str(e))
+                continue
+            for name in names:
+                if os.path.splitext(name)[1] != m3u.EXTENSION or self.scanner.is_excluded(name):
+                    continue
+                try:
+                    included_in_m3u.update(self.scanner.get_m3u_members(os.path.join(folder, name)))
+                except OSError as e:
+                    print("Could not read " + os.path.join(folder, name) + ": " + str(e))
+
+        entries = []
+        for path in added:
+            if path in included_in_m3u or not os.path.isfile(path):
+                continue
+            try:
+                entries.append([path, self.hasher.hash_item(path)])
+            except Exception as e:
+                print("Could not hash " + path + ": " + str(e))
+                entries.append([path, "DETECT"])
+
+        if entries or removed:
+            args = {"added": entries, "removed": removed, "playlist": self.playlist}
+            sublime.set_timeout(lambda: self.view.run_command("lpl_apply_folder_changes", args), 0)
+
+
+class LplWatchFoldersCommand(LplMissingEntriesBaseCommand, sublime_plugin.TextCommand):
+
+    @instrumented
+    def run(self, edit):
+        folder_watch = folder_watches.get(self.view.id())
+        if folder_watch:
+            folder_watch.stop()
+            self.show_status_message("Stopped watching ROM folders.")
+            return
+
+        if not self.view.file_name():
+            self.show_status_message("Save the playlist before watching its ROM folders.")
+            return
+
+        self.get_json_data()
+        folders = sorted(folder for folder in self.get_folders() if os.path.isdir(folder))
+        FolderWatch(self.view, folders, self.get_current_playlist()).start()
+        self.show_status_message("Watching " + str(len(folders)) + " ROM folder(s) for changes.")
+
+
+'''
+    Applies a batch of changes from FolderWatch. added is a list of [path, crc32
+    field value], removed a list of paths and playlist the playlist name, used as
+    db_name when there's no entry to copy.
+'''
+class LplApplyFolderChangesCommand(LplBaseCommand, sublime_plugin.TextCommand):
+
+    @instrumented
+    def run(self, edit, added=None, removed=None, playlist=""):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        self.get_json_data()
+        items = self.json_data["items"]
+        existing_items = set(item["path"] for item in items)
+        removed = set(removed or [])
+
+        updated_items = []
+        for index, item in enumerate(items):
+            if item["path"] in removed:
+                self.errors.add("Entry removed for \'" + item["path"] + "\'", "REMOVED", index, item["label"])
+            else:
+                updated_items.append(item)
+
+        added_count = 0
+        for path, crc32 in added or []:
+            if path in existing_items:
+                continue
+            if items:
+                new_entry = copy.deepcopy(items[0])
+            else:
+                new_entry = OrderedDict([("path", ""), ("label", ""), ("core_path", "DETECT"), ("core_name", "DETECT"),
+                    ("crc32", ""), ("db_name", playlist + ".lpl")])
+            new_entry["path"] = path
+            new_entry["label"] = os.path.splitext(os.path.basename(path))[0]
+            new_entry["crc32"] = crc32
+            updated_items.insert(0, new_entry)
+            added_count += 1
+            self.errors.add("Entry added for \'" + path + "\'", "ADDED", None, new_entry["label"])
+
+        if not self.errors:
+            return
+        self.json_data["items"] = updated_items
+        self.update_data(edit)
+        show_results_panel(self.get_window(), last_results)
+        self.show_status_message("Watch: " + str(added_count) + " entry(s) added, " + str(len(items) + added_count - len(updated_items)) + " removed.")
+
+        if added_count and settings.get("watch_add_thumbnails", False):
+            sublime.set_timeout(lambda: self.view.run_command("lpl_add_missing_thumbnails"), 0)
+
+
+class LplWarmUpListener(sublime_plugin.EventListener):
+
+    def on_activated_async(self, view):
+        global warmed_up
+
+        if warmed_up or not (view.file_name() or "").endswith(".lpl"):
+            return
+        warmed_up = True
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        if settings.get("warm_up_on_playlist_open", True):
+            warm_up()
+
+
+class LplFolderWatchListener(sublime_plugin.EventListener):
+
+    def on_close(self, view):
+        folder_watch = folder_watches.get(view.id())
+        if folder_watch:
+            folder_watch.stop()
+
+
+'''
+    Builds a complete playlist from the ROMs in a folder. Files are hashed (or serial
+    probed) in parallel and labeled with the matching name from the system's RDB.
+'''
+class LplBuildPlaylistFromFolderCommand(LplCrcBaseCommand, sublime_plugin.WindowCommand):
+
+    def get_window(self):
+        return self.window
+
+    def run(self, folder=None, system=None):
+        if folder is None:
+            self.window.show_input_panel("ROM folder:", "", lambda folder: self.run(folder, system), None, None)
+            return
+
+        if system is None:
+            systems = self.get_registry().get_systems()
+            self.window.show_quick_panel(systems, lambda index: self.run(folder, systems[index]) if index >= 0 else None)
+            return
+
+        sublime.set_timeout_async(lambda: self.build(folder, system), 0)
+
+    def scan_folder(self, folder, extensions):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        name_exclusions = settings.get("name_exclusions", [])
+        extension_exclusions = settings.get("extension_exclusions", [])
+
+        paths = []
+        included_in_m3u = set()
+        with self.metrics.phase(instrumentation.SCAN):
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    extension = os.path.splitext(entry.name)[1]
+                    if extension not in extensions or extension in extension_exclusions or entry.name in name_exclusions:
+                        continue
+                    if not entry.is_file():
+                        continue
+                    paths.append(entry.path)
+                    if extension == m3u.EXTENSION:
+                        included_in_m3u.update(self.get_m3u_members(entry.path))
+        return [path for path in paths if path not in included_in_m3u]
+
+    @instrumented
+    def build(self, folder, system):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        self.init_results()
+        self.init_hashing(system)
+
+        system_registry = self.get_registry()
+        extensions = set(system_registry.get_extensions(system))
+        extensions.add(m3u.EXTENSION)
+
+        database = None
+        retroarch_rdb_path = settings.get("retroarch_rdb_path", "")
+        if retroarch_rdb_path:
+            rdb.configure_cache(settings.get("rdb_cache_max_mb", rdb.DEFAULT_CACHE_MAX_MB))
+            with self.metrics.phase(instrumentation.RDB_LOAD):
+                try:
+                    database = rdb.load_rdbs(retroarch_rdb_path, [system])[system]
+                except Exception as e:
+                    self.warnings.add("[RDB] Could not load database for " + system + ": " + str(e), "RDB")
+
+        sublime.status_message("Building playlist for " + folder + "...")
+        paths = self.scan_folder(folder, extensions)
+
+        items = []
+        with self.metrics.phase(instrumentation.HASH):
+            for path, crc32, error in self.get_device_scheduler().map(self.hash_item, paths):
+                self.metrics.count(instrumentation.FILES_OPENED)
+                file_label = os.path.splitext(os.path.basename(path))[0]
+                if error:
+                    crc32 = "DETECT"
+                    self.warnings.add("[SKIPPING] " + file_label + " could not be hashed due to: " + str(error), "SKIPPING", len(items), file_label)
+
+                label = file_label
+                if database and crc32 != "DETECT":
+                    with self.metrics.phase(instrumentation.LOOKUP):
+                        games = database.find_games_by_key(crc32.split("|")[0])
+                    if games:
+                        label = games[0].name
+                    else:
+                        self.warnings.add("[MISSING] " + file_label + " with CRC " + crc32.split("|")[0] + " not found in database.", "MISSING", len(items), file_label)
+
+                items.append(OrderedDict([
+                    ("path", path),
+                    ("label", label),
+                    ("core_path", "DETECT"),
+                    ("core_name", "DETECT"),
+                    ("crc32", crc32),
+                    ("db_name", system + ".lpl")
+                ]))
+        self.save_crc_cache()
+
+        items.sort(key=lambda item: item["label"].lower())
+        self.json_data = OrderedDict([
+            ("version", "1.5"),
+            ("default_core_path", ""),
+            ("default_core_name", ""),
+            ("label_display_mode", 0),
+            ("right_thumbnail_mode", 0),
+            ("left_thumbnail_mode", 0),
+            ("sort_mode", 0),
+            ("items", items)
+        ])
+        with self.metrics.phase(instrumentation.WRITE):
+            body = json.dumps(self.json_data, indent=2, separators=(',', ': ')) + '\n'
+        sublime.set_timeout(lambda: self.show_playlist(system, body), 0)
+
+        self.show_warnings()
+        self.show_status_message("Built playlist with " + str(len(items)) + " item(s).")
+
+    def show_playlist(self, system, body):
+        view = self.window.new_file()
+        view.set_name(system + ".lpl")
+        view.assign_syntax("Packages/JSON/JSON.sublime-syntax")
+        view.run_command("append", {"characters": body})
+
+
+'''
+    Pages through the results of the last command run in the output panel.
+'''
+class ResultPage:
+
+    PANEL_NAME = "lplhelper"
+
+    def __init__(self, collector, page_size):
+        self.collector = collector
+        self.page_size = page_size
+        self.start = 0
+        self.shown = False
+
+    def render_next(self):
+        lines = []
+        if self.start == 0:
+            lines.append(str(len(self.collector.errors)) + " error(s), " + str(len(self.collector.warnings)) + " warning(s)\n")
+        page = list(self.collector.get_results(None, self.start, self.page_size))
+        for result in page:
+            prefix = "E " if result.severity == results.ERROR else "W "
+            lines.append(prefix + result.details)
+        self.start += len(page)
+        remaining = len(self.collector.records) - self.start
+        if remaining > 0:
+            lines.append("\n... " + str(remaining) + " more. Run 'LplHelper: Show More Results' to continue.")
+        elif self.collector.dropped:
+            lines.append("\n... " + str(self.collector.dropped) + " more weren't kept (results_max_records), see results_output_file.")
+        return "\n".join(lines) + "\n"
+
+
+def show_results_panel(window, page, more=False):
+    if not window or not page:
+        return
+    if page.shown and not more:
+        return
+    if more:
+        panel = window.find_output_panel(ResultPage.PANEL_NAME)
+        if panel is None or page.start >= len(page.collector.records):
+            return
+    else:
+        panel = window.create_output_panel(ResultPage.PANEL_NAME)
+    panel.run_command("append", {"characters": page.render_next()})
+    page.shown = True
+    window.run_command("show_panel", {"panel": "output." + ResultPage.PANEL_NAME})
+
+
+class LplShowMoreResultsCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        show_results_panel(self.window, last_results, True)
+
+
+class LplExportResultsCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        if not last_results:
+            sublime.status_message("No results to export.")
+            return
+        self.window.show_input_panel("Export results to (.csv, .json or .jsonl):", "", self.export, None, None)
+
+    def export(self, path):
+        last_results.collector.export(path)
+        sublime.status_message("Results exported to " + path)
+
+
+class LplProfileNextRunCommand(sublime_plugin.ApplicationCommand):
+
+    def run(self):
+        global profile_next_run
+        profile_next_run = True
+        sublime.status_message("The next LplHelper command will be profiled.")
+
+
+class LplWarmRdbCacheCommand(LplBaseCommand, sublime_plugin.ApplicationCommand):
+
+    def run(self, extensions=None):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        retroarch_rdb_path = settings.get("retroarch_rdb_path", "")
+
+        if not retroarch_rdb_path:
+            return
+
+        if extensions is None:
+            extensions = settings.get("rdb_cache_warm_extensions", [])
+
+        threading.Thread(target=self.warm, args=(retroarch_rdb_path, extensions, settings.get("rdb_cache_max_mb")), daemon=True).start()
+
+    def warm(self, retroarch_rdb_path, extensions, max_mb):
+        try:
+            rdb.configure_cache(rdb.DEFAULT_CACHE_MAX_MB if max_mb is None else max_mb)
+            rdbs = rdb.load_rdbs(retroarch_rdb_path, self.get_registry().get_rdb_systems_for_extensions(extensions))
+        except Exception as e:
+            print("Could not warm RDB cache: " + str(e))
+            return
+        sublime.status_message("RDB cache warmed with " + str(len(rdbs)) + " database(s).")
+
+
+'''
+    Starts the helper service (python -m service) with the interpreter set in
+    service_python_path. The service keeps running after Sublime Text exits.
+'''
+class LplStartServiceCommand(sublime_plugin.ApplicationCommand):
+
+    def run(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        if get_helper_client():
+            sublime.status_message("LplHelper service is already running.")
+            return
+
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        if not os.path.isdir(os.path.join(package_dir, "service")):
+            sublime.error_message("LplHelper must be installed unpacked to run the helper service.")
+            return
+
+        args = [settings.get("service_python_path", "") or "python3", "-m", "service",
+            "--port", str(settings.get("service_port", service.DEFAULT_PORT)),
+            "--cache-dir", get_service_cache_dir(),
+            "--workers", str(settings.get("hash_workers", 4)),
+            "--rdb-cache-max-mb", str(settings.get("rdb_cache_max_mb", rdb.DEFAULT_CACHE_MAX_MB)),
+            "--thumbnail-cache-max-mb", str(settings.get("thumbnail_download_cache_max_mb", 512)),
+            "--thumbnail-cache-ttl-hours", str(settings.get("thumbnail_download_cache_ttl_hours", 1)),
+            "--fingerprint-mb", str(settings.get("crc_fingerprint_mb", 1)),
+            "--thumbnails-url", settings.get("retroarch_remote_thumbnails_path", "") or service.DEFAULT_THUMBNAILS_URL]
+        env = dict(os.environ)
+        env["LPLHELPER_SERVICE_TOKEN"] = settings.get("service_token", "")
+
+        try:
+            if os.name == "nt":
+                subprocess.Popen(args, cwd=package_dir, env=env, creationflags=subprocess.CREATE_NO_WINDOW)
+            else:
+                subprocess.Popen(args, cwd=package_dir, env=env, start_new_session=True)
+        except OSError as e:
+            sublime.error_message("Could not start LplHelper service: " + str(e))
+            return
+        sublime.status_message("Started LplHelper service.")
+
+
+class LplStopServiceCommand(sublime_plugin.ApplicationCommand):
+
+    def run(self):
+        global helper_client
+
+        client = get_helper_client()
+        if client is None:
+            sublime.status_message("LplHelper service is not running.")
+            return
+        try:
+            client.shutdown()
+        except (OSError, service_client.ServiceError) as e:
+            print("Could not stop LplHelper service: " + str(e))
+        client.close()
+        helper_client = None
+        sublime.status_message("Stopped LplHelper service.")
+
+
 class LplThumbnailsBaseCommand(LplBaseCommand):
     BOXARTS = "Named_Boxarts"
     SNAPS = "Named_Snaps"
@@ -355,39 +1415,111 @@ class LplThumbnailsBaseCommand(LplBaseCommand):
 
     MAX_TYPE_WIDTH = max(len(BOXARTS), len(SNAPS), len(TITLES), len(LOGOS))
 
-    SANITIZE_REGEX = "[&\*/:`<>?\\\|\"]"
-
     FAN_TRANSLATION_SIGNIFIER = " (English)"
 
     @staticmethod
     def sanitize_label(label):
-        return re.sub(LplThumbnailsBaseCommand.SANITIZE_REGEX, '_', label)
+        return thumbnails.sanitize_label(label)
 
     @staticmethod
     def get_local_thumbnail_file(path, name):
-        return os.path.join(path, LplThumbnailsBaseCommand.sanitize_label(name) + ".png")
+        return thumbnails.get_local_thumbnail_file(path, name)
 
     @staticmethod
     def open_remote_file(url):
-        data = None
-        with urllib.request.urlopen(url) as response:
-            data = response.read()
-        return data
+        return thumbnails.open_remote_file(url)
 
     @staticmethod
     def compare_local_remote_files(local_file, remote_file):
-        if len(local_file) != len(remote_file):
-            return False
-        return local_file == remote_file
+        return thumbnails.compare_local_remote_files(local_file, remote_file)
 
     @staticmethod
     def save_thumbnail(remote_thumbnail, local_thumbnail_path):
-        with open(local_thumbnail_path, 'wb') as f:
-            f.write(remote_thumbnail)
+        thumbnails.save_thumbnail(remote_thumbnail, local_thumbnail_path)
+
+    def fetch_remote(self, url):
+        self.metrics.count(instrumentation.HTTP_REQUESTS)
+        with self.metrics.phase(instrumentation.HTTP):
+            data = LplThumbnailsBaseCommand.open_remote_file(url)
+        self.metrics.count(instrumentation.BYTES_READ, len(data))
+        return data
+
+    '''
+    With refresh, the thumbnail is always fetched from the remote and only stored
+    in the download cache, so validating never trusts a cached copy while a later
+    update can reuse what it fetched.
+    '''
+    def fetch_remote_thumbnail(self, url, refresh=False):
+        if self.helper_client:
+            try:
+                self.metrics.count(instrumentation.HTTP_REQUESTS)
+                with self.metrics.phase(instrumentation.HTTP):
+                    return self.helper_client.fetch_thumbnail(url, refresh)
+            except urllib_error.HTTPError:
+                raise
+            except (OSError, service_client.ServiceError) as e:
+                self.helper_failed(e)
+        if self.download_cache is None:
+            return self.fetch_remote(url)
+        return self.download_cache.fetch(url, self.fetch_remote, refresh)
+
+    def write_thumbnail(self, thumbnail_type, remote_thumbnail, local_thumbnail_path):
+        with self.metrics.phase(instrumentation.WRITE):
+            LplThumbnailsBaseCommand.save_thumbnail(remote_thumbnail, local_thumbnail_path)
+        if self.optimize_enabled:
+            self.optimize_jobs.append((thumbnail_type, local_thumbnail_path, remote_thumbnail))
+        elif self.get_manifest():
+            self.manifest.remove(thumbnail_type, local_thumbnail_path)
+
+    def get_manifest(self):
+        if self.manifest is None and self.retroarch_local_thumbnails_path:
+            self.manifest = optimize.OptimizedManifest(os.path.join(self.retroarch_local_thumbnails_path, self.current_playlist))
+        return self.manifest
+
+    '''
+    True if the local thumbnail is the remote one, or an optimized version of it.
+    '''
+    def matches_remote(self, thumbnail_type, local_thumbnail_path, local_thumbnail, remote_thumbnail):
+        if LplThumbnailsBaseCommand.compare_local_remote_files(local_thumbnail, remote_thumbnail):
+            return True
+        manifest = self.get_manifest()
+        return manifest is not None and manifest.matches(thumbnail_type, local_thumbnail_path, local_thumbnail, remote_thumbnail)
+
+    '''
+    Optimizes the thumbnails written during the run in parallel. zlib releases the
+    GIL while compressing, so threads are used rather than processes, which can't
+    be started from the plugin host.
+    '''
+    def optimize_thumbnails(self):
+        if not self.optimize_jobs:
+            return
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        max_size = settings.get("thumbnail_optimize_max_size", 0)
+        level = settings.get("thumbnail_optimize_level", 9)
+        if max_size and not optimize.can_downscale():
+            print("Pillow isn't installed, thumbnails won't be downscaled.")
+
+        original_bytes = 0
+        optimized_bytes = 0
+        manifest = self.get_manifest()
+        with self.metrics.phase(instrumentation.WRITE):
+            with futures.ThreadPoolExecutor(max_workers=settings.get("thumbnail_optimize_workers", 4)) as executor:
+                pending = [(job, executor.submit(optimize.optimize_file, job[1], max_size, level)) for job in self.optimize_jobs]
+                for (thumbnail_type, local_thumbnail_path, remote_thumbnail), future in pending:
+                    try:
+                        original_size, optimized = future.result()
+                    except Exception as e:
+                        self.warnings.add("[OPTIMIZE] " + local_thumbnail_path + " could not be optimized due to: " + str(e), "OPTIMIZE")
+                        continue
+                    original_bytes += original_size
+                    optimized_bytes += len(optimized)
+                    if manifest:
+                        manifest.record(thumbnail_type, local_thumbnail_path, remote_thumbnail, optimized)
+        print("Optimized " + str(len(self.optimize_jobs)) + " thumbnail(s) from " + str(original_bytes) + " to " + str(optimized_bytes) + " bytes.")
+        self.optimize_jobs = []
 
     def get_remote_thumbnail_file(self, type, label):
-        sanitized_label = LplThumbnailsBaseCommand.sanitize_label(label)
-        return self.retroarch_remote_thumbnails_path + "/" + quote(self.current_playlist) + "/" + type + "/" + quote(sanitized_label) + ".png"
+        return thumbnails.get_remote_thumbnail_file(self.retroarch_remote_thumbnails_path, self.current_playlist, type, label)
 
     def init_thumbnail_command(self, use_logos=True):
         settings = sublime.load_settings("LplHelper.sublime-settings")
@@ -399,6 +1531,27 @@ class LplThumbnailsBaseCommand(LplBaseCommand):
             self.thumbnail_types = [LplThumbnailsBaseCommand.BOXARTS, LplThumbnailsBaseCommand.SNAPS, LplThumbnailsBaseCommand.TITLES, LplThumbnailsBaseCommand.LOGOS]
         else:
             self.thumbnail_types = [LplThumbnailsBaseCommand.BOXARTS, LplThumbnailsBaseCommand.SNAPS, LplThumbnailsBaseCommand.TITLES]
+        self.remote_index = thumbnails.RemoteThumbnailIndex()
+
+        self.download_cache = None
+        if settings.get("thumbnail_download_cache_enabled", True):
+            cache_dir = os.path.join(sublime.cache_path(), "LplHelper", "downloads")
+            max_bytes = settings.get("thumbnail_download_cache_max_mb", 512) * 1024 * 1024
+            ttl = settings.get("thumbnail_download_cache_ttl_hours", 1) * 3600
+            self.download_cache = thumbnails.DownloadCache(cache_dir, max_bytes, ttl)
+        self.init_helper_client()
+
+        self.optimize_enabled = settings.get("thumbnail_optimize_enabled", False)
+        self.optimize_jobs = []
+        self.manifest = None
+
+    def load_remote_index(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        if not settings.get("remote_thumbnail_index_enabled", True):
+            return
+        cache_dir = os.path.join(sublime.cache_path(), "LplHelper", "thumbnail_index")
+        ttl = settings.get("remote_thumbnail_index_ttl_hours", 24) * 3600
+        self.remote_index.load(self.retroarch_remote_thumbnails_path, self.current_playlist, self.thumbnail_types, cache_dir, ttl, self.fetch_remote)
 
     def get_local_thumbnail_dir(self, type):
         return os.path.join(self.retroarch_local_thumbnails_path, self.current_playlist, type)
@@ -414,8 +1567,41 @@ class LplThumbnailsBaseCommand(LplBaseCommand):
             return None
         return translation_mapping[self.current_playlist][original_label]
 
+    def get_suggestions_message(self, thumbnail_type, remote_label):
+        count = self.get_suggestion_count()
+        names = self.remote_index.names.get(thumbnail_type)
+        if count <= 0 or not names:
+            return ""
+        index = suggest.get_index(self.remote_index, thumbnail_type, lambda: [name[:-4] for name in names])
+        suggestions = index.query(LplThumbnailsBaseCommand.sanitize_label(remote_label), count)
+        if not suggestions:
+            return ""
+        return " Closest remote names: " + suggest.format_suggestions(suggestions)
+
+    def add_missing_remote_result(self, index, label, thumbnail_type, local_exists, update_thumbnails, remote_label):
+        if local_exists:
+            if not update_thumbnails:
+                if LplThumbnailsBaseCommand.FAN_TRANSLATION_SIGNIFIER in label:
+                    self.warnings.add("[FANXLATE] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' doesn't exist, but may have a different original label (FAN TRANSLATION).", "FANXLATE", index, label)
+                else:
+                    self.warnings.add("[REMOTE  ] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' doesn't exist.", "REMOTE", index, label)
+        else:
+            self.warnings.add("[NOTEXIST] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' thumbnails don't exist for local or remote." + self.get_suggestions_message(thumbnail_type, remote_label), "NOTEXIST", index, label)
+
     def validate_thumbnails(self, update_thumbnails=False, add_missing_only=False):
-        for item in self.json_data["items"]:
+        self.load_remote_index()
+
+        try:
+            self.validate_items_thumbnails(update_thumbnails, add_missing_only)
+            self.optimize_thumbnails()
+        finally:
+            if self.download_cache:
+                self.download_cache.save()
+            if self.manifest:
+                self.manifest.save()
+
+    def validate_items_thumbnails(self, update_thumbnails, add_missing_only):
+        for index, item in enumerate(self.json_data["items"]):
             label = item["label"]
 
             for thumbnail_type in self.thumbnail_types:
@@ -433,50 +1619,51 @@ class LplThumbnailsBaseCommand(LplBaseCommand):
                 mapped_label = self.get_mapped_label(label)
                 if mapped_label:
                     print("Using mapped label \'" + mapped_label + "\' for \'" + label + "\'")
-                    remote_thumbnail_path = self.get_remote_thumbnail_file(thumbnail_type, mapped_label)
+                    remote_label = mapped_label
                 elif LplThumbnailsBaseCommand.FAN_TRANSLATION_SIGNIFIER in label:
                     print("Using label without (English) suffix for \'" + label + "\'")
-                    remote_thumbnail_path = self.get_remote_thumbnail_file(thumbnail_type, label.replace(LplThumbnailsBaseCommand.FAN_TRANSLATION_SIGNIFIER, ''))
+                    remote_label = label.replace(LplThumbnailsBaseCommand.FAN_TRANSLATION_SIGNIFIER, '')
                 else:
-                    remote_thumbnail_path = self.get_remote_thumbnail_file(thumbnail_type, label)
+                    remote_label = label
+                remote_thumbnail_path = self.get_remote_thumbnail_file(thumbnail_type, remote_label)
+
+                # Use the remote listing to skip requests for thumbnails that don't exist
+                if self.remote_index.exists(thumbnail_type, remote_label) == False:
+                    self.add_missing_remote_result(index, label, thumbnail_type, local_exists, update_thumbnails, remote_label)
+                    continue
 
                 # Open the remote thumbnail to check if it exists
                 try:
-                    remote_thumbnail = LplThumbnailsBaseCommand.open_remote_file(remote_thumbnail_path)
-                except urllib.error.HTTPError as e:
-                    if local_exists:
-                        if e.code != 404:
-                            print("Error found while trying to get remote thumbnail " + remote_thumbnail_path)
-                            raise e
-                        if not update_thumbnails:
-                            if LplThumbnailsBaseCommand.FAN_TRANSLATION_SIGNIFIER in label:
-                                self.warnings.append("[FANXLATE] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' doesn't exist, but may have a different original label (FAN TRANSLATION).")
-                            else:
-                                self.warnings.append("[REMOTE  ] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' doesn't exist.")
-                    else:
-                        self.warnings.append("[NOTEXIST] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' thumbnails don't exist for local or remote.")
+                    remote_thumbnail = self.fetch_remote_thumbnail(remote_thumbnail_path, not update_thumbnails)
+                except urllib_error.HTTPError as e:
+                    if local_exists and e.code != 404:
+                        print("Error found while trying to get remote thumbnail " + remote_thumbnail_path)
+                        raise e
+                    self.add_missing_remote_result(index, label, thumbnail_type, local_exists, update_thumbnails, remote_label)
                     continue
 
                 # Download remote to local
                 if not local_exists:
                     if update_thumbnails:
-                        LplThumbnailsBaseCommand.save_thumbnail(remote_thumbnail, local_thumbnail_path)
-                        self.errors.append("[" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' downloaded to " + local_thumbnail_path)
+                        self.write_thumbnail(thumbnail_type, remote_thumbnail, local_thumbnail_path)
+                        self.errors.add("[" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' downloaded to " + local_thumbnail_path, "DOWNLOADED", index, label)
                     else:
-                        self.errors.append("[LOCAL   ] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' doesn't exist.")
+                        self.errors.add("[LOCAL   ] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' doesn't exist.", "LOCAL", index, label)
                     continue
 
                 # Do comparison
                 local_thumbnail = None
                 with open(local_thumbnail_path, 'rb') as file:
                     local_thumbnail = file.read()
+                self.metrics.count(instrumentation.FILES_OPENED)
+                self.metrics.count(instrumentation.BYTES_READ, len(local_thumbnail))
 
-                if not LplThumbnailsBaseCommand.compare_local_remote_files(local_thumbnail, remote_thumbnail):
+                if not self.matches_remote(thumbnail_type, local_thumbnail_path, local_thumbnail, remote_thumbnail):
                     if update_thumbnails:
-                        LplThumbnailsBaseCommand.save_thumbnail(remote_thumbnail, local_thumbnail_path)
-                        self.errors.append("[" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' updated to " + local_thumbnail_path)
+                        self.write_thumbnail(thumbnail_type, remote_thumbnail, local_thumbnail_path)
+                        self.errors.add("[" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\' updated to " + local_thumbnail_path, "UPDATED", index, label)
                     else:
-                        self.errors.append("[MISMATCH] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\'  thumbnails don't match.")
+                        self.errors.add("[MISMATCH] [" + thumbnail_type.ljust(LplThumbnailsBaseCommand.MAX_TYPE_WIDTH) + "] \'" + label + "\'  thumbnails don't match.", "MISMATCH", index, label)
 
 
 class LplCountThumbnailsCommand(LplThumbnailsBaseCommand, sublime_plugin.TextCommand):
@@ -484,17 +1671,18 @@ class LplCountThumbnailsCommand(LplThumbnailsBaseCommand, sublime_plugin.TextCom
     def check_folder(self, thumbnail_type, expected_count):
         folder = self.get_local_thumbnail_dir(thumbnail_type)
         if not os.path.isdir(folder):
-            self.warnings.append(folder + " doesn't exist.")
+            self.warnings.add(folder + " doesn't exist.", "FOLDER")
         else:
             found_count = len(os.listdir(folder))
             if expected_count != found_count:
-                self.warnings.append("Expected count: " + str(expected_count) + ", " + thumbnail_type + " count: " + str(found_count))
+                self.warnings.add("Expected count: " + str(expected_count) + ", " + thumbnail_type + " count: " + str(found_count), "COUNT")
 
+    @instrumented
     def run(self, edit):
         self.init_thumbnail_command()
         self.get_json_data()
 
-        for item in self.json_data["items"]:
+        for index, item in enumerate(self.json_data["items"]):
             label = item["label"]
 
             for thumbnail_type in self.thumbnail_types:
@@ -504,7 +1692,7 @@ class LplCountThumbnailsCommand(LplThumbnailsBaseCommand, sublime_plugin.TextCom
                     continue
                 expected_path = LplThumbnailsBaseCommand.get_local_thumbnail_file(folder_path, label)
                 if not os.path.isfile(expected_path):
-                    self.warnings.append(expected_path + " doesn't exist.")
+                    self.warnings.add(expected_path + " doesn't exist.", "LOCAL", index, label)
 
         expected_count = len(self.json_data["items"])
 
@@ -517,6 +1705,7 @@ class LplCountThumbnailsCommand(LplThumbnailsBaseCommand, sublime_plugin.TextCom
 
 class LplValidateThumbnailsCommand(LplThumbnailsBaseCommand,  sublime_plugin.TextCommand):
 
+     @instrumented
      def run(self, edit):
         self.init_thumbnail_command()
         self.get_json_data()
@@ -527,6 +1716,7 @@ class LplValidateThumbnailsCommand(LplThumbnailsBaseCommand,  sublime_plugin.Tex
 
 class LplUpdateThumbnailsCommand(LplThumbnailsBaseCommand,  sublime_plugin.TextCommand):
 
+     @instrumented
      def run(self, edit):
         self.init_thumbnail_command()
         self.get_json_data()
@@ -537,6 +1727,7 @@ class LplUpdateThumbnailsCommand(LplThumbnailsBaseCommand,  sublime_plugin.TextC
 
 class LplAddMissingThumbnailsCommand(LplThumbnailsBaseCommand,  sublime_plugin.TextCommand):
 
+     @instrumented
      def run(self, edit):
         self.init_thumbnail_command()
         self.get_json_data()
@@ -546,46 +1737,50 @@ class LplAddMissingThumbnailsCommand(LplThumbnailsBaseCommand,  sublime_plugin.T
 
 
 class LplConvertPathsBaseCommand(LplBaseCommand):
-    path_separator = "!"
-    core_extension = ".?"
+    platform = None
     rom_path = ""
     core_path = ""
 
     def convert_paths(self):
-        if not self.rom_path:
-            raise Exception("rom_path is not specified")
-
-        if not self.core_path:
-            raise Exception("core_path is not specified")
-
-        if not self.rom_path.endswith(self.path_separator):
-            self.rom_path += self.path_separator
-
-        if not self.core_path.endswith(self.path_separator):
-            self.core_path += self.path_separator
-
-        self.json_data['default_core_path'] = self.convert_core_path(self.json_data['default_core_path'])
-
-        for item in self.json_data["items"]:
-            item['path'] = self.convert_rom_path(item['path'])
-            if item['core_path'] != "DETECT":
-                item['core_path'] = self.convert_core_path(item['core_path'])
-
-
-    def convert_rom_path(self, path):
-        filename = os.path.split(path)[1]
-        rom_folder_name = os.path.split(os.path.split(path)[0])[1]
-        return self.rom_path + rom_folder_name + self.path_separator + filename
-
-    def convert_core_path(self, path):
-        basename = os.path.splitext(os.path.basename(path))[0]
-        return self.core_path + basename + self.core_extension
+        target = convert.PathTarget.from_options(self.platform, {"rom_path": self.rom_path, "core_path": self.core_path})
+        self.json_data = target.convert(self.json_data)
+
+    '''
+    Targets from convert_targets. The windows and macos targets fall back to the
+    windows_*/macos_* path settings.
+    '''
+    def get_targets(self):
+        settings = sublime.load_settings("LplHelper.sublime-settings")
+        targets = []
+        for name, options in settings.get("convert_targets", {}).items():
+            options = dict(options)
+            if name in ("windows", "macos"):
+                options.setdefault("rom_path", settings.get(name + "_rom_path", ""))
+                options.setdefault("core_path", settings.get(name + "_core_path", ""))
+            if not options.get("output_dir"):
+                raise Exception("output_dir is not specified for " + name)
+            targets.append(convert.PathTarget.from_options(name, options))
+        if not targets:
+            raise Exception("No convert_targets configured")
+        return targets
+
+    '''
+    Writes the playlist converted for each target to the target's output_dir,
+    replacing existing files atomically. Returns the written paths.
+    '''
+    def write_targets(self, json_data, playlist_file, targets):
+        written = []
+        for output_file, converted in convert.convert_for_targets(json_data, playlist_file, targets):
+            os.makedirs(os.path.dirname(output_file) or os.curdir, exist_ok=True)
+            atomicfile.atomic_write(output_file, convert.dumps_playlist(converted).encode('utf-8'))
+            written.append(output_file)
+        return written
 
 
 class LplConvertPathsForWindowsCommand(LplConvertPathsBaseCommand,  sublime_plugin.TextCommand):
-    path_separator = "\\"
-    core_extension = ".dll"
+    platform = "windows"
 
+    @instrumented
     def run(self, edit):
         settings = sublime.load_settings("LplHelper.sublime-settings")
         self.rom_path = settings.get("windows_rom_path", "")
@@ -598,9 +1793,9 @@ class LplConvertPathsForWindowsCommand(LplConvertPathsBaseCommand,  sublime_plug
 
 
 class LplConvertPathsForMacosCommand(LplConvertPathsBaseCommand,  sublime_plugin.TextCommand):
-    path_separator = "/"
-    core_extension = ".dylib"
+    platform = "macos"
 
+    @instrumented
     def run(self, edit):
         settings = sublime.load_settings("LplHelper.sublime-settings")
         self.rom_path = settings.get("macos_rom_path", "")
@@ -610,3 +1805,66 @@ class LplConvertPathsForMacosCommand(LplConvertPathsBaseCommand,  sublime_plugin
         self.convert_paths()
         self.update_data(edit)
         self.show_status_message("Done converting for MacOS!")
+
+
+'''
+    Converts the open playlist for every target in convert_targets and writes the
+    results to their output_dir, leaving the open playlist unchanged.
+'''
+class LplConvertPathsToTargetsCommand(LplConvertPathsBaseCommand,  sublime_plugin.TextCommand):
+
+    @instrumented
+    def run(self, edit):
+        if not self.view.file_name():
+            self.show_status_message("Save the playlist before converting it for all targets.")
+            return
+
+        targets = self.get_targets()
+        self.get_json_data()
+
+        with self.metrics.phase(instrumentation.WRITE):
+            written = self.write_targets(self.json_data, self.view.file_name(), targets)
+        print("\n".join(written))
+        self.show_status_message("Wrote " + str(len(written)) + " converted playlist(s).")
+
+
+'''
+    Converts every .lpl file in a folder for every target in convert_targets. Each
+    playlist is parsed once and written to each target's output_dir.
+'''
+class LplConvertPlaylistFolderCommand(LplConvertPathsBaseCommand, sublime_plugin.WindowCommand):
+
+    def get_window(self):
+        return self.window
+
+    def run(self, folder=None):
+        if folder is None:
+            self.window.show_input_panel("Playlist folder:", "", lambda folder: self.run(folder), None, None)
+            return
+
+        sublime.set_timeout_async(lambda: self.convert_folder(folder), 0)
+
+    @instrumented
+    def convert_folder(self, folder):
+        self.init_results()
+        targets = self.get_targets()
+
+        with self.metrics.phase(instrumentation.SCAN):
+            with os.scandir(folder) as entries:
+                playlist_files = sorted(entry.path for entry in entries if entry.is_file() and entry.name.endswith(".lpl"))
+
+        written = 0
+        converted = 0
+        for index, playlist_file in enumerate(playlist_files):
+            name = os.path.basename(playlist_file)
+            try:
+                with self.metrics.phase(instrumentation.PARSE):
+                    json_data = convert.load_playlist(playlist_file)
+                with self.metrics.phase(instrumentation.WRITE):
+                    written += len(self.write_targets(json_data, playlist_file, targets))
+                converted += 1
+            except Exception as e:
+                self.errors.add("[CONVERT] " + name + " could not be converted due to: " + str(e), "CONVERT", index, name)
+
+        self.show_errors("playlist(s) could not be converted")
+        self.show_status_message("Wrote " + str(written) + " converted playlist(s) for " + str(converted) + " playlist(s).")
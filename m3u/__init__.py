@@ -0,0 +1,59 @@
+import os
+import threading
+
+EXTENSION = ".m3u"
+
+
+'''
+    Returns the disc paths listed in an m3u, resolved relative to its folder.
+    Blank lines and #EXT comments are skipped.
+'''
+def parse(path):
+    folder = os.path.dirname(path)
+    members = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                members.append(os.path.join(folder, line))
+    return members
+
+
+'''
+    Parsed m3u files keyed by path, reused while the file's size and mtime are
+    unchanged. Members are returned as tuples so callers can't change the cached
+    copy.
+'''
+class M3uCache:
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_members(self, path):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry[0] == stamp:
+            return entry[1]
+
+        members = tuple(parse(path))
+        with self.lock:
+            self.entries[path] = (stamp, members)
+        return members
+
+    '''
+    Returns dict of disc path to the m3u paths listing it, so discs shared by
+    several m3u files are only processed once.
+    '''
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+__cache = M3uCache()
+
+
+def get_cache():
+    return __cache
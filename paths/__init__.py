@@ -0,0 +1,103 @@
+import os
+
+# Path check results
+FOUND = 1
+CASE_MISMATCH = 2
+NOT_A_FILE = 3
+MISSING = 4
+MISSING_DIRECTORY = 5
+UNREADABLE_DIRECTORY = 6
+
+
+'''
+    Entries of one directory, read with a single scandir. names maps each entry
+    name to whether it's a file; folded maps the case-folded name to the names.
+'''
+class DirectoryListing:
+
+    def __init__(self, entries):
+        self.names = {}
+        self.folded = {}
+        for name, is_file in entries:
+            self.names[name] = is_file
+            self.folded.setdefault(name.casefold(), []).append(name)
+
+    def find_case_insensitive(self, name):
+        return self.folded.get(name.casefold(), [])
+
+
+'''
+    Checks many paths with one scandir per unique directory instead of a stat per
+    path, which matters on network mounts. Listings are cached for the lifetime of
+    the index.
+'''
+class PathIndex:
+
+    def __init__(self):
+        self.listings = {}
+        self.errors = {}
+        self.scandir_count = 0
+
+    '''
+    Returns the DirectoryListing for directory, or None if it doesn't exist or
+    can't be read. The error for the latter is kept in errors.
+    '''
+    def get_listing(self, directory):
+        directory = directory or os.curdir
+        if directory in self.listings:
+            return self.listings[directory]
+
+        listing = None
+        try:
+            self.scandir_count += 1
+            with os.scandir(directory) as entries:
+                listing = DirectoryListing([(entry.name, entry.is_file()) for entry in entries])
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        except OSError as e:
+            self.errors[directory] = e
+        self.listings[directory] = listing
+        return listing
+
+    '''
+    Returns tuple of result and the name(s) actually on disk for CASE_MISMATCH, the
+    missing directory for MISSING_DIRECTORY, or the directory for
+    UNREADABLE_DIRECTORY.
+    '''
+    def check(self, path):
+        directory, name = os.path.split(path)
+        listing = self.get_listing(directory)
+        if listing is None and (directory or os.curdir) in self.errors:
+            return (UNREADABLE_DIRECTORY, directory or os.curdir)
+        if listing is None:
+            return (MISSING_DIRECTORY, self.find_missing_directory(directory))
+        if name in listing.names:
+            return (FOUND, None) if listing.names[name] else (NOT_A_FILE, None)
+        matches = [match for match in listing.find_case_insensitive(name) if listing.names[match]]
+        if matches:
+            return (CASE_MISMATCH, matches)
+        return (MISSING, None)
+
+    '''
+    Returns the topmost directory of path that doesn't exist.
+    '''
+    def find_missing_directory(self, directory):
+        while True:
+            parent = os.path.dirname(directory)
+            if not parent or parent == directory or self.get_listing(parent) is not None:
+                return directory
+            directory = parent
+
+    '''
+    Returns the on-disk spelling of directory if it only differs in case from the
+    missing directory, otherwise None.
+    '''
+    def find_directory_case_mismatch(self, directory):
+        parent, name = os.path.split(directory)
+        listing = self.get_listing(parent)
+        if listing is None:
+            return None
+        for match in listing.find_case_insensitive(name):
+            if not listing.names[match]:
+                return os.path.join(parent, match)
+        return None
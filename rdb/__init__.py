@@ -2,61 +2,8 @@ import binascii
 import math
 import os
 import sys
-
-def __get_rdb_files(extension):
-    if extension == ".zip":
-        return [
-                "FBNeo - Arcade Games.rdb",
-                "Sega - Naomi.rdb"
-                ]
-    if extension == ".wsc":
-        return ["Bandai - WonderSwan Color.rdb"]
-    if extension == ".fds":
-        return ["Nintendo - Family Computer Disk System.rdb"]
-    if extension == ".gba":
-        return ["Nintendo - Game Boy Advance.rdb"]
-    if extension == ".gbc":
-        return ["Nintendo - Game Boy Color.rdb"]
-    if extension == ".gb":
-        return ["Nintendo - Game Boy.rdb"]
-    if extension == ".rvz":
-        return [
-                "Nintendo - GameCube.rdb",
-                "Nintendo - Wii.rdb"
-                ]
-    if extension == ".z64":
-        return ["Nintendo - Nintendo 64.rdb"]
-    if extension == ".nds":
-        return ["Nintendo - Nintendo DS.rdb"]
-    if extension == ".nes":
-        return ["Nintendo - Nintendo Entertainment System.rdb"]
-    if extension == ".bs":
-        return ["Nintendo - Satellaview.rdb"]
-    if extension == ".sfc":
-        return ["Nintendo - Super Nintendo Entertainment System.rdb"]
-    if extension == ".vb":
-        return ["Nintendo - Virtual Boy.rdb"]
-    if extension == ".sms":
-        return ["Sega - Master System - Mark III.rdb"]
-    if extension == ".md":
-        return ["Sega - Mega Drive - Genesis.rdb"]
-    if extension == ".ngc":
-        return ["SNK - Neo Geo Pocket Color.rdb"]
-    if extension == ".pce":
-        return ["NEC - PC Engine - TurboGrafx 16.rdb"]
-    elif extension == ".chd":
-        return [
-                "Sony - PlayStation.rdb",
-                "Sony - PlayStation 2.rdb",
-                "Sony - PlayStation Portable.rdb",
-                "Sega - Dreamcast.rdb",
-                "Sega - Saturn.rdb",
-                "Sega - Mega-CD - Sega CD.rdb",
-                "NEC - PC-FX.rdb",
-                "NEC - PC Engine CD - TurboGrafx-CD.rdb",
-                "Philips - CD-i.rdb"
-                ]
-    raise Exception("No database for extension type " + extension)
+import threading
+from collections import OrderedDict
 
 
 class SearchResult:
@@ -349,36 +296,130 @@ class RdbReader:
         return results
 
 
-def __find_game(games, name, crc32):
-    result = (SearchResult.NOT_FOUND, 0)
+'''
+    Games from a single RDB, indexed by CRC/serial and by name so that lookups
+    don't have to walk every entry.
+'''
+class RdbDatabase:
+
+    def __init__(self, games):
+        self.games = games
+        self.by_key = {}
+        self.by_name = {}
+        for game in games:
+            if game.crc32:
+                self.by_key.setdefault(game.crc32, []).append(game)
+            if game.serial and game.serial != game.crc32:
+                self.by_key.setdefault(game.serial, []).append(game)
+            self.by_name.setdefault(game.name, []).append(game)
+
+    def find_games_by_key(self, crc32):
+        return self.by_key.get(crc32, [])
+
+    def find_game(self, name, crc32):
+        key_matches = self.by_key.get(crc32)
+        if key_matches:
+            for game in key_matches:
+                if name == game.name:
+                    return (SearchResult.FOUND, 1)
+            return (SearchResult.CRC_MATCH_ONLY, key_matches[-1].name)
+
+        name_matches = self.by_name.get(name)
+        if name_matches:
+            return (SearchResult.NAME_MATCH_ONLY, name_matches[-1].crc32)
+
+        return (SearchResult.NOT_FOUND, 0)
 
-    for game in games:
-        if crc32 == game.crc32 or (game.serial and crc32 == game.serial):
-            if name == game.name:
-                return (SearchResult.FOUND, 1)
-            else:
-                result = (SearchResult.CRC_MATCH_ONLY, game.name)
-        elif name == game.name:
-            if result[0] != SearchResult.CRC_MATCH_ONLY:
-                result = (SearchResult.NAME_MATCH_ONLY, game.crc32)
+    '''
+    Rough estimate of the memory held by the parsed games, used for the cache budget.
+    '''
+    def estimated_size(self):
+        size = 0
+        for game in self.games:
+            size += RdbDatabase.GAME_OVERHEAD + len(game.name) + len(game.rom_name) + len(game.serial)
+        return size
 
-    return result
+    GAME_OVERHEAD = 400
+
+
+'''
+    Process-wide LRU cache of loaded RDBs keyed by path. Entries are invalidated
+    when the file's mtime or size changes.
+'''
+class RdbCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.__evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get(self, path):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[0] == stamp:
+                self.entries.move_to_end(path)
+                return entry[1]
+
+        database = RdbDatabase(RdbReader().read(path))
+        size = database.estimated_size()
+
+        with self.lock:
+            if path in self.entries:
+                self.total_bytes -= self.entries.pop(path)[2]
+            self.entries[path] = (stamp, database, size)
+            self.total_bytes += size
+            self.__evict()
+
+        return database
+
+    def __evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            path, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry[2]
+            print("Evicted " + path + " from RDB cache")
+
+
+DEFAULT_CACHE_MAX_MB = 512
+
+__cache = RdbCache(DEFAULT_CACHE_MAX_MB * 1024 * 1024)
+
+
+def get_cache():
+    return __cache
+
+
+def configure_cache(max_mb):
+    __cache.set_max_bytes(max_mb * 1024 * 1024)
 
 
 def __least_severe_result(result1, result2):
     return result1 if result1 <= result2 else result2
 
 
-def load_rdbs(rdb_dir, extensions):
+'''
+    Returns dict of system name to RdbDatabase, loading "<system>.rdb" files from rdb_dir.
+'''
+def load_rdbs(rdb_dir, systems):
     result = {}
-    for extension in extensions:
-        rdb_files = __get_rdb_files(extension)
-        for rdb_file in rdb_files:
-            key = rdb_file[:-4]
-            if key not in result:
-                path = os.path.join(rdb_dir, rdb_file)
-                reader = RdbReader()
-                result[key] = reader.read(path)
+    for system in systems:
+        if system not in result:
+            path = os.path.join(rdb_dir, system + ".rdb")
+            result[system] = __cache.get(path)
     return result
 
 '''
@@ -390,14 +431,14 @@ def load_rdbs(rdb_dir, extensions):
 def find_game_in_rdbs(rdbs, name, crc32, preferred_system=None):
     result = (SearchResult.NOT_FOUND, 0)
     if preferred_system and preferred_system in rdbs:
-        result = __least_severe_result(result, __find_game(rdbs[preferred_system], name, crc32))
+        result = __least_severe_result(result, rdbs[preferred_system].find_game(name, crc32))
         if result[0] == SearchResult.FOUND:
             return result
 
     for key in rdbs:
         if key == preferred_system:
             continue
-        result = __least_severe_result(result, __find_game(rdbs[key], name, crc32))
+        result = __least_severe_result(result, rdbs[key].find_game(name, crc32))
         if result[0] == SearchResult.FOUND:
             break
 
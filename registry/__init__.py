@@ -0,0 +1,158 @@
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "systems.json")
+
+
+class HashStrategy:
+    CRC = "crc"
+    INES = "ines"
+    SERIAL = "serial"
+    M3U = "m3u"
+    ARCHIVE = "archive"
+    SKIP = "skip"
+
+    ALL = (CRC, INES, SERIAL, M3U, ARCHIVE, SKIP)
+
+
+'''
+    Lookup tables compiled from the declarative system registry.
+
+    Registry format:
+        {
+            "hash_by_extension": { "<extension>": "<hash strategy>" },
+            "systems": {
+                "<system name>": {
+                    "extensions": ["<extension>"],
+                    "playlists": ["<alternate playlist name>"],
+                    "serial": "<serial strategy>",
+                    "hash_by_extension": { "<extension>": "<hash strategy>" }
+                }
+            }
+        }
+
+    The RDB for a system is expected to be named "<system name>.rdb".
+'''
+class Registry:
+
+    def __init__(self, data):
+        self.systems_by_extension = OrderedDict()
+        self.system_by_playlist = {}
+        self.serial_by_system = {}
+        self.hash_plans = {}
+
+        self.default_hash_plan = dict(data.get("hash_by_extension", {}))
+        Registry.__check_hash_plan(self.default_hash_plan)
+
+        for system, entry in data.get("systems", {}).items():
+            for extension in entry.get("extensions", []):
+                self.systems_by_extension.setdefault(extension, []).append(system)
+
+            self.system_by_playlist[system] = system
+            for playlist in entry.get("playlists", []):
+                self.system_by_playlist[playlist] = system
+
+            if entry.get("serial"):
+                self.serial_by_system[system] = entry["serial"]
+
+            hash_plan = dict(self.default_hash_plan)
+            hash_plan.update(entry.get("hash_by_extension", {}))
+            Registry.__check_hash_plan(hash_plan)
+            self.hash_plans[system] = hash_plan
+
+    @staticmethod
+    def __check_hash_plan(hash_plan):
+        for extension, strategy in hash_plan.items():
+            if strategy not in HashStrategy.ALL:
+                raise Exception("Unknown hash strategy '" + str(strategy) + "' for extension " + extension)
+
+    def get_system(self, playlist):
+        return self.system_by_playlist.get(playlist, playlist)
+
+    def get_extensions(self, playlist):
+        system = self.get_system(playlist)
+        return [extension for extension, systems in self.systems_by_extension.items() if system in systems]
+
+    def get_systems(self):
+        return list(self.hash_plans)
+
+    def has_rdb_systems(self, extension):
+        return extension in self.systems_by_extension
+
+    def get_rdb_systems(self, extension):
+        if extension not in self.systems_by_extension:
+            raise Exception("No database for extension type " + extension)
+        return self.systems_by_extension[extension]
+
+    def get_rdb_systems_for_extensions(self, extensions):
+        result = []
+        for extension in extensions:
+            for system in self.get_rdb_systems(extension):
+                if system not in result:
+                    result.append(system)
+        return result
+
+    '''
+    Returns dict of extension to HashStrategy for the playlist. Extensions not in
+    the dict use HashStrategy.CRC.
+    '''
+    def get_hash_plan(self, playlist):
+        return self.hash_plans.get(self.get_system(playlist), self.default_hash_plan)
+
+    def get_serial_strategy(self, playlist):
+        system = self.get_system(playlist)
+        if system not in self.serial_by_system:
+            raise Exception("No serial support for system " + system)
+        return self.serial_by_system[system]
+
+
+'''
+    Applies user overrides on top of the default registry data. Systems in the
+    overrides replace the default entry; a null entry removes the system.
+'''
+def merge_registry_data(data, overrides):
+    result = copy.deepcopy(data)
+    if not overrides:
+        return result
+
+    result.setdefault("hash_by_extension", OrderedDict()).update(overrides.get("hash_by_extension", {}))
+
+    systems = result.setdefault("systems", OrderedDict())
+    for system, entry in overrides.get("systems", {}).items():
+        if entry is None:
+            systems.pop(system, None)
+        else:
+            systems[system] = entry
+    return result
+
+
+def load_default_data():
+    with open(DEFAULT_REGISTRY_FILE) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+__lock = threading.Lock()
+__compiled = None
+__compiled_key = None
+
+
+'''
+    Returns a compiled Registry, reusing the previous one if neither the default
+    data nor the overrides changed.
+'''
+def get_registry(default_json=None, overrides=None):
+    global __compiled, __compiled_key
+
+    key = (default_json, json.dumps(overrides, sort_keys=True))
+    with __lock:
+        if __compiled is None or __compiled_key != key:
+            if default_json is None:
+                data = load_default_data()
+            else:
+                data = json.loads(default_json, object_pairs_hook=OrderedDict)
+            __compiled = Registry(merge_registry_data(data, overrides))
+            __compiled_key = key
+        return __compiled
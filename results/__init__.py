@@ -0,0 +1,173 @@
+import csv
+import json
+import os
+import time
+
+ERROR = "error"
+WARNING = "warning"
+
+FIELDS = ["severity", "category", "index", "label", "details"]
+
+DEFAULT_MAX_RECORDS = 100000
+
+
+class Result:
+    __slots__ = FIELDS
+
+    def __init__(self, severity, category, index, label, details):
+        self.severity = severity
+        self.category = category
+        self.index = index
+        self.label = label
+        self.details = details
+
+    def __str__(self):
+        return self.details
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in FIELDS)
+
+
+'''
+    List-like view over the results of one severity. append() takes a plain
+    message for compatibility; add() records the structured fields as well.
+    Iterating yields the messages.
+'''
+class ResultList:
+
+    def __init__(self, collector, severity):
+        self.collector = collector
+        self.severity = severity
+        self.count = 0
+
+    def add(self, details, category=None, index=None, label=None):
+        self.count += 1
+        self.collector.record(Result(self.severity, category, index, label, details))
+
+    def append(self, details):
+        self.add(details)
+
+    def __iadd__(self, other):
+        for details in other:
+            self.add(details)
+        return self
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self):
+        for result in self.collector.get_results(self.severity):
+            yield result.details
+
+
+'''
+    Collects results for a command run and forwards each one to the listeners
+    (e.g. an output file) as soon as it's recorded. Only the first max_records
+    are kept in memory; the rest are counted in dropped and only reach the
+    listeners.
+'''
+class ResultCollector:
+
+    def __init__(self, max_records=DEFAULT_MAX_RECORDS):
+        self.records = []
+        self.max_records = max_records
+        self.dropped = 0
+        self.listeners = []
+        self.errors = ResultList(self, ERROR)
+        self.warnings = ResultList(self, WARNING)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def record(self, result):
+        if self.max_records is None or len(self.records) < self.max_records:
+            self.records.append(result)
+        else:
+            self.dropped += 1
+        for listener in self.listeners:
+            listener.write(result)
+
+    def get_results(self, severity=None, start=0, count=None):
+        found = 0
+        for result in self.records:
+            if severity and result.severity != severity:
+                continue
+            if found >= start:
+                if count is not None and found >= start + count:
+                    return
+                yield result
+            found += 1
+
+    def close(self):
+        for listener in self.listeners:
+            listener.close()
+        self.listeners = []
+
+    def export(self, path):
+        sink = FileSink(path)
+        try:
+            for result in self.records:
+                sink.write(result)
+        finally:
+            sink.close()
+
+
+'''
+    Returns the file a run streams its results to. .csv and JSON lines files are
+    appended to; a .json array can't be, so each run gets its own file with the
+    start time added to the name.
+'''
+def get_run_output_path(path):
+    base, extension = os.path.splitext(path)
+    if extension.lower() != ".json":
+        return path
+    base += time.strftime("-%Y%m%d-%H%M%S")
+    run_path = base + extension
+    count = 1
+    while os.path.exists(run_path):
+        count += 1
+        run_path = base + "-" + str(count) + extension
+    return run_path
+
+
+'''
+    Writes results to a file as they arrive. The format is chosen by extension:
+    .csv, .json (an array, completed on close) or anything else as JSON lines.
+    With append, .csv and JSON lines results are added to the end of the file.
+'''
+class FileSink:
+
+    def __init__(self, path, append=False):
+        self.extension = os.path.splitext(path)[1].lower()
+        append = append and self.extension != ".json"
+        self.file = open(path, 'a' if append else 'w', newline='', encoding='utf-8')
+        self.first = True
+        self.writer = None
+        if self.extension == ".csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+        elif self.extension == ".json":
+            self.file.write("[")
+
+    def write(self, result):
+        if self.writer:
+            self.writer.writerow(result.to_dict())
+            return
+        line = json.dumps(result.to_dict())
+        if self.extension == ".json":
+            line = ("\n  " if self.first else ",\n  ") + line
+        else:
+            line += "\n"
+        self.first = False
+        self.file.write(line)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.extension == ".json":
+            self.file.write("\n]\n")
+        self.file.close()
@@ -3,21 +3,13 @@ import subprocess
 
 CREATE_NO_WINDOW = 0x08000000
 
-def get_serial(path, system, chd_serial_path):
-    if system == "Nintendo - GameCube":
-        return __get_gc_serial(path)
-    elif system == "Nintendo - Wii":
-        return __get_wii_serial(path)
-
-    elif system == "Sega - Dreamcast" or \
-         system == "Sega - Mega-CD - Sega CD" or \
-         system == "Sega - Saturn" or \
-         system == "Sony - PlayStation 2" or \
-         system == "Sony - PlayStation Portable" or \
-         system == "Sony - PlayStation":
-        return __get_chd_serial(chd_serial_path, path)
-
-    raise Exception("No serial support for system " + system)
+'''
+    strategy is one of the keys in SERIAL_STRATEGIES, as configured per system in the registry.
+'''
+def get_serial(path, strategy, chd_serial_path):
+    if strategy not in SERIAL_STRATEGIES:
+        raise Exception("No serial support for strategy " + str(strategy))
+    return SERIAL_STRATEGIES[strategy](path, chd_serial_path)
 
 
 def __read_at_offset(path, offset, length):
@@ -101,3 +93,10 @@ def __get_chd_serial(chd_serial_path, chd_path, use_subprocess=True):
         return result.strip()
     else:
         raise Exception("Only chd_serial subprocess supported.")
+
+
+SERIAL_STRATEGIES = {
+    "gamecube": lambda path, chd_serial_path: __get_gc_serial(path),
+    "wii": lambda path, chd_serial_path: __get_wii_serial(path),
+    "chd": lambda path, chd_serial_path: __get_chd_serial(chd_serial_path, path)
+}
@@ -0,0 +1,18 @@
+import os
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47563
+DEFAULT_THUMBNAILS_URL = "http://thumbnails.libretro.com"
+TOKEN_FILE_NAME = "token"
+
+
+'''
+    Returns the token the service wrote to its cache dir when it started, or ""
+    if there is none.
+'''
+def read_token(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, TOKEN_FILE_NAME), 'r') as token_file:
+            return token_file.read().strip()
+    except OSError:
+        return ""
@@ -0,0 +1,51 @@
+import argparse
+import os
+import secrets
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service import DEFAULT_PORT, DEFAULT_THUMBNAILS_URL, TOKEN_FILE_NAME
+from service import server
+
+
+'''
+    Writes the token to the cache dir, readable only by the current user, so the
+    plugin can find a generated token.
+'''
+def write_token(cache_dir, token):
+    os.makedirs(cache_dir, exist_ok=True)
+    token_file = os.path.join(cache_dir, TOKEN_FILE_NAME)
+    fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token_file
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m service", description="LplHelper helper service")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--token", default=os.environ.get("LPLHELPER_SERVICE_TOKEN", ""))
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "LplHelper"))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rdb-cache-max-mb", type=int, default=512)
+    parser.add_argument("--thumbnail-cache-max-mb", type=int, default=512)
+    parser.add_argument("--thumbnail-cache-ttl-hours", type=float, default=1)
+    parser.add_argument("--fingerprint-mb", type=float, default=1)
+    parser.add_argument("--thumbnails-url", default=DEFAULT_THUMBNAILS_URL)
+    args = parser.parse_args()
+
+    token = args.token or secrets.token_hex(16)
+    print("LplHelper service token written to " + write_token(args.cache_dir, token))
+
+    state = server.ServiceState(args.cache_dir, args.workers, args.rdb_cache_max_mb,
+        args.thumbnail_cache_max_mb, args.thumbnail_cache_ttl_hours, int(args.fingerprint_mb * 1024 * 1024), args.thumbnails_url)
+    try:
+        server.serve(state, args.port, token)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import base64
+import json
+import socket
+import threading
+import urllib.error
+
+from . import DEFAULT_HOST, DEFAULT_PORT
+
+
+class ServiceError(Exception):
+    pass
+
+
+'''
+    Client for the LplHelper helper service. Requests are sent one at a time over a
+    single connection; each response is a stream of items ending with "done".
+'''
+class Client:
+
+    def __init__(self, port=DEFAULT_PORT, token="", timeout=None, host=DEFAULT_HOST):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def connect(self, timeout=1.0):
+        self.sock = socket.create_connection((self.host, self.port), timeout)
+        self.sock.settimeout(self.timeout)
+        self.reader = self.sock.makefile('r', encoding='utf-8')
+
+    def close(self):
+        if self.sock:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+
+    '''
+    Yields the items streamed back for the request. The lock is held until the
+    generator is exhausted, so consume it fully.
+    '''
+    def request(self, method, params=None):
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            self.next_id += 1
+            message = {"id": self.next_id, "method": method, "params": params or {}, "token": self.token}
+            try:
+                self.sock.sendall((json.dumps(message) + "\n").encode('utf-8'))
+                while True:
+                    line = self.reader.readline()
+                    if not line:
+                        raise ServiceError("Connection closed by service")
+                    response = json.loads(line)
+                    if "error" in response:
+                        raise ServiceError(response["error"])
+                    if response.get("done"):
+                        return
+                    yield response["item"]
+            except (OSError, ValueError, GeneratorExit):
+                # Unread responses would be mixed into the next request
+                self.close()
+                raise
+
+    def call(self, method, params=None):
+        return list(self.request(method, params))
+
+    def ping(self):
+        return self.call("ping")[0]
+
+    '''
+    files is a list of (path, offset). mode is a hashing CRC cache mode, or None
+    for the service's default. Yields (index, crc, error) as each completes.
+    '''
+    def crc32(self, files, mode=None):
+        for item in self.request("crc32", {"files": [list(file) for file in files], "mode": mode}):
+            yield (item["index"], item.get("crc"), item.get("error"))
+
+    def find_game(self, rdb_dir, systems, name, crc32, preferred_system=None):
+        params = {"rdb_dir": rdb_dir, "systems": systems, "name": name, "crc32": crc32, "preferred_system": preferred_system}
+        return tuple(self.call("find_game", params)[0])
+
+    def suggest_names(self, rdb_dir, systems, name, count):
+        params = {"rdb_dir": rdb_dir, "systems": systems, "name": name, "count": count}
+        return [tuple(pair) for pair in self.call("suggest_names", params)]
+
+    def fetch_thumbnail(self, url, refresh=False):
+        result = self.call("fetch_thumbnail", {"url": url, "refresh": refresh})[0]
+        if "http_error" in result:
+            raise urllib.error.HTTPError(url, result["http_error"], "Service fetch failed", None, None)
+        return base64.b64decode(result["data"])
+
+    def stats(self):
+        return self.call("stats")[0]
+
+    def shutdown(self):
+        return self.call("shutdown")
@@ -0,0 +1,171 @@
+import base64
+import concurrent.futures
+import hmac
+import json
+import os
+import socketserver
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import hashing
+import rdb
+import suggest
+import thumbnails
+
+from service import DEFAULT_HOST, DEFAULT_THUMBNAILS_URL
+
+
+'''
+    Warm state owned by the service and shared by all connections.
+'''
+class ServiceState:
+
+    def __init__(self, cache_dir, workers, rdb_cache_max_mb, thumbnail_cache_max_mb, thumbnail_cache_ttl_hours,
+            fingerprint_size=hashing.DEFAULT_FINGERPRINT_SIZE, thumbnails_url=DEFAULT_THUMBNAILS_URL):
+        self.start_time = time.time()
+        self.cache_dir = cache_dir
+        self.crc_cache_file = os.path.join(cache_dir, "crc_cache.json")
+        self.crc_cache = hashing.CrcCache(hashing.MTIME, fingerprint_size)
+        self.crc_cache.load(self.crc_cache_file)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.download_cache = thumbnails.DownloadCache(os.path.join(cache_dir, "downloads"),
+            thumbnail_cache_max_mb * 1024 * 1024, thumbnail_cache_ttl_hours * 3600)
+        self.download_lock = threading.Lock()
+        self.thumbnails_url = thumbnails_url.rstrip("/") + "/"
+        self.request_count = 0
+        rdb.configure_cache(rdb_cache_max_mb)
+
+    def save(self):
+        self.crc_cache.save(self.crc_cache_file)
+        with self.download_lock:
+            self.download_cache.save()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.save()
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                return
+            request_id = request.get("id")
+            try:
+                if not hmac.compare_digest(str(request.get("token", "")), self.server.token):
+                    raise Exception("Invalid token")
+                method = getattr(self, "do_" + str(request.get("method")), None)
+                if method is None:
+                    raise Exception("Unknown method " + str(request.get("method")))
+                self.server.state.request_count += 1
+                for item in method(request.get("params", {})):
+                    self.send({"id": request_id, "item": item})
+                self.send({"id": request_id, "done": True})
+            except Exception as e:
+                self.send({"id": request_id, "error": str(e)})
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode('utf-8'))
+        self.wfile.flush()
+
+    def do_ping(self, params):
+        yield {"pid": os.getpid(), "uptime": time.time() - self.server.state.start_time}
+
+    def do_crc32(self, params):
+        state = self.server.state
+        futures = {}
+        for index, (path, offset) in enumerate(params["files"]):
+            futures[state.executor.submit(self.get_crc32, path, offset, params.get("mode"))] = index
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield {"index": futures[future], "crc": future.result()}
+            except Exception as e:
+                yield {"index": futures[future], "error": str(e)}
+
+    def get_crc32(self, path, offset, mode):
+        if not os.path.isabs(path) or not os.path.isfile(path):
+            raise Exception("Not a file: " + str(path))
+        return self.server.state.crc_cache.get_crc32(path, offset, mode)
+
+    def do_find_game(self, params):
+        rdbs = rdb.load_rdbs(params["rdb_dir"], params["systems"])
+        yield list(rdb.find_game_in_rdbs(rdbs, params["name"], params["crc32"], params.get("preferred_system")))
+
+    def do_suggest_names(self, params):
+        rdbs = rdb.load_rdbs(params["rdb_dir"], params["systems"])
+        suggestions = []
+        for database in rdbs.values():
+            index = suggest.get_index(database, "names", lambda database=database: [game.name for game in database.games])
+            suggestions += index.query(params["name"], params["count"])
+        for name, score in sorted(suggestions, key=lambda pair: pair[1], reverse=True)[:params["count"]]:
+            yield [name, score]
+
+    def do_fetch_thumbnail(self, params):
+        state = self.server.state
+        url = params["url"]
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https") or not url.startswith(state.thumbnails_url):
+            raise Exception("Not a thumbnails URL: " + url)
+
+        data = None
+        if not params.get("refresh", False):
+            with state.download_lock:
+                data = state.download_cache.get(url)
+        if data is None:
+            try:
+                data = thumbnails.open_remote_file(url)
+            except urllib.error.HTTPError as e:
+                yield {"http_error": e.code}
+                return
+            with state.download_lock:
+                state.download_cache.put(url, data)
+        yield {"data": base64.b64encode(data).decode('ascii')}
+
+    def do_stats(self, params):
+        state = self.server.state
+        yield {
+            "uptime": time.time() - state.start_time,
+            "requests": state.request_count,
+            "rdb_cache_bytes": rdb.get_cache().total_bytes,
+            "rdb_cache_entries": len(rdb.get_cache().entries),
+            "crc_cache_entries": len(state.crc_cache.entries),
+            "thumbnail_cache_entries": len(state.download_cache.entries)
+        }
+
+    def do_shutdown(self, params):
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        yield {}
+
+
+class Server(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, state, port, token, host=DEFAULT_HOST):
+        if not token:
+            raise ValueError("The service requires a token")
+        super().__init__((host, port), Handler)
+        self.state = state
+        self.token = token
+
+
+def serve(state, port, token, host=DEFAULT_HOST, save_interval=60):
+    server = Server(state, port, token, host)
+    print("LplHelper service listening on " + host + ":" + str(server.server_address[1]))
+
+    def save_periodically():
+        while True:
+            time.sleep(save_interval)
+            state.save()
+
+    threading.Thread(target=save_periodically, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        state.close()
@@ -0,0 +1,97 @@
+import heapq
+import re
+import threading
+import weakref
+
+NORMALIZE_REGEX = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(name):
+    return NORMALIZE_REGEX.sub(" ", name.lower()).strip()
+
+
+def trigrams(text):
+    padded = "  " + text + " "
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(grams1, grams2):
+    if not grams1 or not grams2:
+        return 0.0
+    return 2.0 * len(grams1 & grams2) / (len(grams1) + len(grams2))
+
+
+'''
+    Trigram index over a list of names for "did you mean" suggestions.
+
+    Candidates are gathered from the posting lists of the query's rarest trigrams,
+    skipping trigrams common to a large share of the names (e.g. "usa"), and only
+    the best candidates by shared trigram count are scored exactly.
+'''
+class TrigramIndex:
+
+    COMMON_FRACTION = 0.05
+    MIN_COMMON_COUNT = 200
+    CANDIDATE_COUNT = 20
+    MIN_GRAMS = 3
+    POSTING_BUDGET = 2000
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        self.postings = {}
+        for i, name in enumerate(self.names):
+            for gram in trigrams(normalize(name)):
+                self.postings.setdefault(gram, []).append(i)
+        self.max_posting = max(TrigramIndex.MIN_COMMON_COUNT, int(len(self.names) * TrigramIndex.COMMON_FRACTION))
+
+    def __len__(self):
+        return len(self.names)
+
+    '''
+    Returns up to k (name, score) tuples with score in [0, 1], best first.
+    '''
+    def query(self, name, k=5, min_score=0.3):
+        grams = trigrams(normalize(name))
+        known = [gram for gram in grams if gram in self.postings]
+        if not known:
+            return []
+
+        # Rarest trigrams first; stop once enough postings have been scanned
+        known.sort(key=lambda gram: len(self.postings[gram]))
+        counts = {}
+        scanned = 0
+        for used, gram in enumerate(known):
+            posting = self.postings[gram]
+            if used >= TrigramIndex.MIN_GRAMS and (len(posting) > self.max_posting or scanned >= TrigramIndex.POSTING_BUDGET):
+                break
+            scanned += len(posting)
+            for i in posting:
+                counts[i] = counts.get(i, 0) + 1
+
+        candidates = heapq.nlargest(TrigramIndex.CANDIDATE_COUNT, counts, key=counts.get)
+        scored = []
+        for i in candidates:
+            score = similarity(grams, trigrams(normalize(self.names[i])))
+            if score >= min_score:
+                scored.append((self.names[i], score))
+        return heapq.nlargest(k, scored, key=lambda pair: pair[1])
+
+
+__lock = threading.Lock()
+__indexes = weakref.WeakKeyDictionary()
+
+
+'''
+    Returns the TrigramIndex cached for owner and key, building it from names_fn()
+    the first time. Indexes are dropped along with their owner.
+'''
+def get_index(owner, key, names_fn):
+    with __lock:
+        owner_indexes = __indexes.setdefault(owner, {})
+        if key not in owner_indexes:
+            owner_indexes[key] = TrigramIndex(names_fn())
+        return owner_indexes[key]
+
+
+def format_suggestions(suggestions):
+    return "; ".join(name + " (" + str(int(score * 100)) + "%)" for name, score in suggestions)
@@ -0,0 +1,241 @@
+import hashlib
+import html
+import json
+import os
+import re
+import time
+import urllib.error
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+# thumbnails is a subpackage of the plugin in Sublime Text and a top-level
+# package in the helper service
+try:
+    from ..atomicfile import atomic_write
+except (ImportError, ValueError):
+    from atomicfile import atomic_write
+
+BOXARTS = "Named_Boxarts"
+SNAPS = "Named_Snaps"
+TITLES = "Named_Titles"
+LOGOS = "Named_Logos"
+
+MAX_TYPE_WIDTH = max(len(BOXARTS), len(SNAPS), len(TITLES), len(LOGOS))
+
+SANITIZE_REGEX = "[&\*/:`<>?\\\|\"]"
+
+FAN_TRANSLATION_SIGNIFIER = " (English)"
+
+
+def sanitize_label(label):
+    return re.sub(SANITIZE_REGEX, '_', label)
+
+
+def get_local_thumbnail_file(path, name):
+    return os.path.join(path, sanitize_label(name) + ".png")
+
+
+def get_remote_thumbnail_file(remote_path, playlist, type, label):
+    return remote_path + "/" + quote(playlist) + "/" + type + "/" + quote(sanitize_label(label)) + ".png"
+
+
+def open_remote_file(url):
+    # Imported on first use, urllib.request pulls in http.client, ssl and email
+    import urllib.request
+
+    data = None
+    with urllib.request.urlopen(url) as response:
+        data = response.read()
+    return data
+
+
+def compare_local_remote_files(local_file, remote_file):
+    if len(local_file) != len(remote_file):
+        return False
+    return local_file == remote_file
+
+
+def save_thumbnail(remote_thumbnail, local_thumbnail_path):
+    atomic_write(local_thumbnail_path, remote_thumbnail)
+
+
+LISTING_HREF_REGEX = re.compile(r'href="([^"?#]+\.png)"', re.IGNORECASE)
+
+
+'''
+    Returns set of .png file names linked from an HTML directory listing.
+'''
+def parse_directory_listing(listing):
+    names = set()
+    for href in LISTING_HREF_REGEX.findall(listing):
+        names.add(unquote(html.unescape(href)).rsplit("/", 1)[-1])
+    return names
+
+
+'''
+    Set of thumbnail names available on the remote server per thumbnail type, built
+    from the directory listings so existence checks don't need a request per label.
+    Listings are cached on disk for ttl seconds.
+'''
+class RemoteThumbnailIndex:
+
+    def __init__(self):
+        self.names = {}
+
+    def load(self, remote_path, playlist, types, cache_dir=None, ttl=0, fetch=open_remote_file):
+        for type in types:
+            self.names[type] = RemoteThumbnailIndex.__load_type(remote_path, playlist, type, cache_dir, ttl, fetch)
+
+    @staticmethod
+    def __get_cache_file(cache_dir, playlist, type):
+        return os.path.join(cache_dir, quote(playlist, safe=''), type + ".json")
+
+    @staticmethod
+    def __load_type(remote_path, playlist, type, cache_dir, ttl, fetch):
+        cache_file = None
+        if cache_dir:
+            cache_file = RemoteThumbnailIndex.__get_cache_file(cache_dir, playlist, type)
+            try:
+                with open(cache_file) as f:
+                    cached = json.load(f)
+                if time.time() - cached["fetched"] < ttl:
+                    return set(cached["names"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        url = remote_path + "/" + quote(playlist) + "/" + type + "/"
+        try:
+            names = parse_directory_listing(fetch(url).decode("utf-8", "replace"))
+        except (urllib.error.URLError, OSError) as e:
+            print("Could not get remote thumbnail listing " + url + ": " + str(e))
+            return None
+
+        # An empty listing most likely means it couldn't be parsed, so don't trust it
+        if not names:
+            return None
+
+        if cache_file:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            atomic_write(cache_file, json.dumps({"fetched": time.time(), "names": sorted(names)}).encode())
+        return names
+
+    '''
+    Returns True/False if the type's listing is available, otherwise None.
+    '''
+    def exists(self, type, label):
+        names = self.names.get(type)
+        if names is None:
+            return None
+        return sanitize_label(label) + ".png" in names
+
+
+'''
+    Content-addressed cache of downloaded thumbnails shared between commands.
+
+    The index maps each URL to the SHA-256 of its content, which is stored once in
+    "<hash>.png" no matter how many URLs share it. Entries older than ttl seconds
+    are refetched, and the least recently used URLs are evicted once the stored
+    content exceeds max_bytes.
+'''
+class DownloadCache:
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir, max_bytes, ttl):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.modified = False
+        try:
+            with open(os.path.join(cache_dir, DownloadCache.INDEX_FILE)) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+
+        # Least recently used first, so eviction pops from the front
+        self.entries = OrderedDict(sorted(entries.items(), key=lambda pair: pair[1]["accessed"]))
+        self.references = {}
+        self.total_bytes = 0
+        for entry in self.entries.values():
+            self.__add_reference(entry)
+
+    def __get_blob_path(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash + ".png")
+
+    def __add_reference(self, entry):
+        count = self.references.get(entry["hash"], 0)
+        if count == 0:
+            self.total_bytes += entry["size"]
+        self.references[entry["hash"]] = count + 1
+
+    '''
+    Removes the URL and deletes its content once no other URL refers to it.
+    '''
+    def __remove(self, url):
+        entry = self.entries.pop(url)
+        count = self.references[entry["hash"]] - 1
+        if count > 0:
+            self.references[entry["hash"]] = count
+            return
+        del self.references[entry["hash"]]
+        self.total_bytes -= entry["size"]
+        try:
+            os.remove(self.__get_blob_path(entry["hash"]))
+        except OSError:
+            pass
+
+    def get(self, url):
+        entry = self.entries.get(url)
+        if entry is None or time.time() - entry["fetched"] >= self.ttl:
+            return None
+        try:
+            with open(self.__get_blob_path(entry["hash"]), 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = None
+        if data is None or hashlib.sha256(data).hexdigest() != entry["hash"]:
+            self.__remove(url)
+            self.modified = True
+            return None
+        entry["accessed"] = time.time()
+        self.entries.move_to_end(url)
+        self.modified = True
+        return data
+
+    def put(self, url, data):
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_path = self.__get_blob_path(content_hash)
+        if not os.path.isfile(blob_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(blob_path, data)
+        now = time.time()
+        entry = {"hash": content_hash, "size": len(data), "fetched": now, "accessed": now}
+        # Reference the new content before dropping the old, so content both share isn't deleted
+        self.__add_reference(entry)
+        if url in self.entries:
+            self.__remove(url)
+        self.entries[url] = entry
+        self.modified = True
+        self.__evict()
+
+    '''
+    Returns the cached content for url, or fetches and caches it. With refresh the
+    content is always fetched.
+    '''
+    def fetch(self, url, fetch=open_remote_file, refresh=False):
+        data = None if refresh else self.get(url)
+        if data is None:
+            data = fetch(url)
+            self.put(url, data)
+        return data
+
+    def __evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            self.__remove(next(iter(self.entries)))
+
+    def save(self):
+        if not self.modified:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        atomic_write(os.path.join(self.cache_dir, DownloadCache.INDEX_FILE), json.dumps(self.entries).encode())
+        self.modified = False
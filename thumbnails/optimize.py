@@ -0,0 +1,149 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import zlib
+
+from . import atomic_write
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Chunks that don't affect how the image is displayed
+METADATA_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+
+MANIFEST_FILE = ".lplhelper-optimized.json"
+
+
+def read_chunks(data):
+    if not data.startswith(PNG_SIGNATURE):
+        raise Exception("Not a PNG file")
+    chunks = []
+    offset = len(PNG_SIGNATURE)
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        chunks.append((chunk_type, data[offset + 8:offset + 8 + length]))
+        offset += 12 + length
+        if chunk_type == b"IEND":
+            break
+    return chunks
+
+
+def write_chunk(chunk_type, body):
+    return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", zlib.crc32(chunk_type + body) & 0xFFFFFFFF)
+
+
+'''
+    Lossless: recompresses the image data at the given zlib level and drops text and
+    time chunks. Pixels are untouched. Returns data unchanged if it isn't smaller.
+'''
+def recompress(data, level=9):
+    chunks = read_chunks(data)
+    image_data = zlib.decompress(b"".join(body for chunk_type, body in chunks if chunk_type == b"IDAT"))
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9)
+    compressed = compressor.compress(image_data) + compressor.flush()
+
+    result = PNG_SIGNATURE
+    for chunk_type, body in chunks:
+        if chunk_type in METADATA_CHUNKS:
+            continue
+        if chunk_type == b"IDAT":
+            if compressed is not None:
+                result += write_chunk(b"IDAT", compressed)
+                compressed = None
+            continue
+        result += write_chunk(chunk_type, body)
+    return result if len(result) < len(data) else data
+
+
+'''
+    Shrinks the image to fit within max_size x max_size. Needs Pillow; returns data
+    unchanged if it isn't installed or the image is already small enough.
+'''
+def downscale(data, max_size):
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    image = Image.open(io.BytesIO(data))
+    if image.width <= max_size and image.height <= max_size:
+        return data
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, "PNG", optimize=True)
+    return output.getvalue()
+
+
+def can_downscale():
+    try:
+        import PIL
+    except ImportError:
+        return False
+    return True
+
+
+def optimize(data, max_size=0, level=9):
+    if max_size:
+        data = downscale(data, max_size)
+    return recompress(data, level)
+
+
+'''
+    Runs in a worker. Optimizes the thumbnail at path in place; returns tuple of
+    original size and the optimized content.
+'''
+def optimize_file(path, max_size=0, level=9):
+    with open(path, 'rb') as f:
+        data = f.read()
+    optimized = optimize(data, max_size, level)
+    if optimized is not data:
+        atomic_write(path, optimized)
+    return (len(data), optimized)
+
+
+'''
+    Records the remote content each optimized thumbnail came from, so an optimized
+    local file still counts as matching its remote source. Stored next to the
+    thumbnail type folders of a playlist.
+'''
+class OptimizedManifest:
+
+    def __init__(self, playlist_dir):
+        self.path = os.path.join(playlist_dir, MANIFEST_FILE)
+        self.modified = False
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def get_key(type, path):
+        return type + "/" + os.path.basename(path)
+
+    def record(self, type, path, remote_data, local_data):
+        self.entries[OptimizedManifest.get_key(type, path)] = {
+            "remote": hashlib.sha256(remote_data).hexdigest(),
+            "local": hashlib.sha256(local_data).hexdigest()
+        }
+        self.modified = True
+
+    def remove(self, type, path):
+        if self.entries.pop(OptimizedManifest.get_key(type, path), None):
+            self.modified = True
+
+    '''
+    True if local_data is the optimized version of remote_data.
+    '''
+    def matches(self, type, path, local_data, remote_data):
+        entry = self.entries.get(OptimizedManifest.get_key(type, path))
+        if entry is None:
+            return False
+        return entry["local"] == hashlib.sha256(local_data).hexdigest() and \
+            entry["remote"] == hashlib.sha256(remote_data).hexdigest()
+
+    def save(self):
+        if not self.modified:
+            return
+        atomic_write(self.path, json.dumps(self.entries, indent=2, sort_keys=True).encode())
+        self.modified = False
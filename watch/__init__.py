@@ -0,0 +1,151 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+ADDED = "added"
+REMOVED = "removed"
+
+
+'''
+    Polls folders for added and removed files. Each poll only lists a folder again
+    if its modification time changed, so idle folders cost one stat per poll. New
+    files are reported once their size stops changing, i.e. once they're copied.
+'''
+class PollingWatcher:
+
+    def __init__(self, folders):
+        self.folders = {}
+        self.pending = {}
+        for folder in folders:
+            self.folders[folder] = self.__scan(folder)
+
+    @staticmethod
+    def __scan(folder):
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as entries:
+                names = set(entry.name for entry in entries if entry.is_file())
+        except OSError:
+            return (None, set())
+        return (mtime, names)
+
+    @staticmethod
+    def __get_size(path):
+        try:
+            return os.stat(path).st_size
+        except OSError:
+            return None
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        changes = []
+
+        for path, size in list(self.pending.items()):
+            current_size = PollingWatcher.__get_size(path)
+            if current_size is None:
+                del self.pending[path]
+            elif current_size == size:
+                del self.pending[path]
+                changes.append((ADDED, path))
+            else:
+                self.pending[path] = current_size
+
+        for folder, (mtime, names) in self.folders.items():
+            try:
+                current_mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                current_mtime = None
+            if current_mtime == mtime:
+                continue
+            current = PollingWatcher.__scan(folder)
+            self.folders[folder] = current
+            for name in current[1] - names:
+                path = os.path.join(folder, name)
+                self.pending[path] = PollingWatcher.__get_size(path)
+            for name in names - current[1]:
+                path = os.path.join(folder, name)
+                if self.pending.pop(path, None) is None:
+                    changes.append((REMOVED, path))
+        return changes
+
+    def close(self):
+        pass
+
+
+'''
+    Linux inotify through ctypes. Files are reported as added once they're closed
+    after writing or moved in, and as removed when deleted or moved out.
+'''
+class InotifyWatcher:
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(InotifyWatcher.IN_NONBLOCK | InotifyWatcher.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches = {}
+        mask = InotifyWatcher.IN_CLOSE_WRITE | InotifyWatcher.IN_MOVED_FROM | InotifyWatcher.IN_MOVED_TO | InotifyWatcher.IN_DELETE
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+            if wd < 0:
+                error = ctypes.get_errno()
+                self.close()
+                raise OSError(error, "Could not watch " + folder)
+            self.watches[wd] = folder
+
+    def poll(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+
+        changes = []
+        offset = 0
+        while offset + InotifyWatcher.EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = InotifyWatcher.EVENT_HEADER.unpack_from(data, offset)
+            offset += InotifyWatcher.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & InotifyWatcher.IN_ISDIR or wd not in self.watches or not name:
+                continue
+            path = os.path.join(self.watches[wd], os.fsdecode(name))
+            if mask & (InotifyWatcher.IN_CLOSE_WRITE | InotifyWatcher.IN_MOVED_TO):
+                changes.append((ADDED, path))
+            elif mask & (InotifyWatcher.IN_DELETE | InotifyWatcher.IN_MOVED_FROM):
+                changes.append((REMOVED, path))
+        return changes
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+'''
+    Returns an InotifyWatcher on Linux, falling back to a PollingWatcher elsewhere
+    or if inotify can't be used (e.g. the watch limit is reached).
+'''
+def create_watcher(folders, use_inotify=True):
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            print("inotify not available, polling instead: " + str(e))
+    return PollingWatcher(folders)